@@ -0,0 +1,163 @@
+"""
+Time each stage of media ingest on synthetic libraries and write the results as JSON.
+
+Usage:
+    python benchmarks/ingest_benchmark.py --sizes 1000 10000 --output ingest.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from components.Database import MediaDatabase, BATCH_SIZE
+from components.Scanner import (
+    SUPPORTED_EXTS, MediaFile, iter_media_directories, iter_chunks, extract_metadata, hash_file
+)
+from synthetic_library import generate_library
+
+def prepare_library(folder, params):
+    """Generate the library unless folder already holds one built from the same params."""
+    manifest = os.path.join(folder, "manifest.json")
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            if json.load(f) == params:
+                return
+        shutil.rmtree(folder)
+
+    generate_library(folder, **params)
+    with open(manifest, "w") as f:
+        json.dump(params, f)
+
+def timed(stages, name, files, func):
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    stages[name] = {
+        "seconds": round(seconds, 4),
+        "files_per_second": round(files / seconds, 1) if seconds > 0 else None,
+    }
+    return result
+
+def walk(root):
+    paths = []
+    for directory in iter_media_directories(root):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTS and entry.is_file():
+                    paths.append(entry.path)
+    return paths
+
+def stat_all(paths):
+    media_files = []
+    for path in paths:
+        stat = os.stat(path)
+        media_files.append(MediaFile(path, stat.st_size, stat.st_mtime_ns))
+    return media_files
+
+def with_hashes(rows, digests):
+    """Fill the hashes into rows probed with hash_contents=False."""
+    hash_column = 11
+    return [row[:hash_column] + (digest,) + row[hash_column + 1:] for row, digest in zip(rows, digests)]
+
+def insert_all(db, rows):
+    progress = db.start_progress()
+    for batch in iter_chunks(rows, BATCH_SIZE):
+        db.insert_media_rows(batch, progress)
+    return progress
+
+def run_size(library, scratch, count, workers):
+    stages = {}
+
+    paths = timed(stages, "walk", count, lambda: walk(library))
+    media_files = timed(stages, "stat", len(paths), lambda: stat_all(paths))
+    # Probing reads headers, hashing reads whole files, so they are timed apart
+    rows = timed(stages, "metadata_probe", len(paths),
+                 lambda: [extract_metadata(m, hash_contents=False) for m in media_files])
+    digests = timed(stages, "hash", len(paths), lambda: [hash_file(m.path) for m in media_files])
+    rows = with_hashes(rows, digests)
+
+    db_path = os.path.join(scratch, f"insert_{count}.db")
+    db = MediaDatabase(db_path, library)
+    db.create_tables()
+    timed(stages, "db_insert", len(rows), lambda: insert_all(db, rows))
+    db.close()
+
+    # End to end, as the app runs it
+    db_path = os.path.join(scratch, f"populate_{count}.db")
+    db = MediaDatabase(db_path, library)
+    db.create_tables()
+    timed(stages, "populate_media", len(paths), lambda: db.populate_media(workers=workers))
+    timed(stages, "rescan_unchanged", len(paths), lambda: db.rescan(workers=workers))
+    db.close()
+
+    return {"files": len(paths), "stages": stages}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000],
+                        help="library sizes to benchmark, e.g. 1000 100000 1000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size-mix", type=json.loads, default=None,
+                        help='JSON weights, e.g. \'{"small": 0.9, "large": 0.1}\'')
+    parser.add_argument("--exif-fraction", type=float, default=0.5)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--video-fraction", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="extraction processes for the end to end stages, 0 for one per CPU")
+    parser.add_argument("--library-dir", default=None,
+                        help="keep generated libraries here and reuse them between runs")
+    parser.add_argument("--output", default=None, help="JSON file to write, printed if omitted")
+    args = parser.parse_args()
+
+    workers = args.workers or None
+    scratch = tempfile.mkdtemp(prefix="ingest_bench_")
+    library_root = args.library_dir or os.path.join(scratch, "libraries")
+
+    report = {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "params": {
+            "seed": args.seed, "size_mix": args.size_mix, "exif_fraction": args.exif_fraction,
+            "depth": args.depth, "video_fraction": args.video_fraction, "workers": args.workers,
+        },
+        "results": [],
+    }
+
+    try:
+        for count in args.sizes:
+            params = {
+                "count": count, "seed": args.seed, "size_mix": args.size_mix,
+                "exif_fraction": args.exif_fraction, "depth": args.depth,
+                "video_fraction": args.video_fraction,
+            }
+            library = os.path.join(library_root, f"library_{count}")
+            prepare_library(library, params)
+            result = run_size(library, scratch, count, workers)
+            report["results"].append(result)
+            print(f"{count:>9} files: " + ", ".join(
+                f"{name} {stage['seconds']:.2f}s" for name, stage in result["stages"].items()
+            ), file=sys.stderr)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Compare the header-only image probe against the Pillow path on a synthetic corpus.
+
+Usage:
+    python benchmarks/probe_benchmark.py --count 2000
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from components.Probe import probe_image
+from components.Scanner import pillow_probe
+from synthetic_library import generate_library
+
+def time_probe(probe, paths):
+    start = time.perf_counter()
+    results = [probe(path) for path in paths]
+    return time.perf_counter() - start, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=1000, help="number of synthetic images")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = generate_library(folder, args.count, args.seed, depth=0, video_fraction=0)
+
+        fast_time, fast_results = time_probe(lambda p: probe_image(p) or pillow_probe(p), paths)
+        pillow_time, pillow_results = time_probe(pillow_probe, paths)
+
+    mismatches = sum(1 for a, b in zip(fast_results, pillow_results) if a != b)
+    print(f"files:      {len(paths)}")
+    print(f"header:     {fast_time:.3f}s ({len(paths) / fast_time:,.0f} files/s)")
+    print(f"pillow:     {pillow_time:.3f}s ({len(paths) / pillow_time:,.0f} files/s)")
+    print(f"speedup:    {pillow_time / fast_time:.1f}x")
+    print(f"mismatches: {mismatches}")
+
+if __name__ == "__main__":
+    main()
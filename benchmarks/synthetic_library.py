@@ -0,0 +1,165 @@
+"""
+Generate a deterministic synthetic media library for benchmarking ingest.
+
+Usage:
+    python benchmarks/synthetic_library.py OUTPUT_DIR --count 10000 --depth 3
+"""
+import argparse
+import json
+import os
+import random
+import struct
+
+from PIL import Image
+
+# Longest image edge, in pixels, for each size class
+IMAGE_SIZES = {"small": 64, "medium": 512, "large": 2048}
+
+# Bytes of padding standing in for frame data, for each size class
+VIDEO_PAYLOADS = {"small": 16 * 1024, "medium": 512 * 1024, "large": 8 * 1024 * 1024}
+
+DEFAULT_SIZE_MIX = {"small": 0.7, "medium": 0.25, "large": 0.05}
+
+def generate_library(root, count=1000, seed=0, size_mix=None, exif_fraction=0.5,
+                     depth=2, fanout=4, video_fraction=0.1):
+    """
+    Write count media files under root. The same arguments always produce
+    the same files, so results are comparable between runs.
+
+    Parameters:
+        size_mix (dict): Weights for the "small", "medium" and "large" size classes.
+        exif_fraction (float): Share of JPEGs written with camera EXIF.
+        depth (int): Levels of nested folders below root.
+        fanout (int): Sub folders per folder.
+        video_fraction (float): Share of files that are videos.
+
+    Returns:
+        list[str]: The generated file paths.
+    """
+    rng = random.Random(seed)
+    size_mix = size_mix or DEFAULT_SIZE_MIX
+    size_names = list(size_mix)
+    size_weights = [size_mix[name] for name in size_names]
+
+    folders = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(parent, f"folder_{i}") for parent in level for i in range(fanout)]
+        folders.extend(level)
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+
+    paths = []
+    for i in range(count):
+        folder = rng.choice(folders)
+        size = rng.choices(size_names, size_weights)[0]
+
+        if rng.random() < video_fraction:
+            kind = rng.choice(["mp4", "mov", "mkv", "avi"])
+            path = os.path.join(folder, f"video_{i:07d}.{kind}")
+            write_video(path, kind, rng, VIDEO_PAYLOADS[size])
+        else:
+            kind = rng.choice(["jpg", "jpg", "png", "gif", "bmp"])
+            path = os.path.join(folder, f"image_{i:07d}.{kind}")
+            with_exif = kind == "jpg" and rng.random() < exif_fraction
+            write_image(path, kind, rng, IMAGE_SIZES[size], with_exif)
+        paths.append(path)
+
+    return paths
+
+def write_image(path, kind, rng, max_edge, with_exif):
+    width = rng.randint(max_edge // 2, max_edge)
+    height = rng.randint(max_edge // 2, max_edge)
+    img = Image.new("RGB", (width, height), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+
+    if kind == "jpg":
+        if with_exif:
+            exif = Image.Exif()
+            exif[272] = f"Camera {rng.randrange(20)}"
+            exif[0x8769] = {36867: f"{rng.randint(2000, 2024)}:{rng.randint(1, 12):02d}:{rng.randint(1, 28):02d} 12:00:00"}
+            img.save(path, "JPEG", exif=exif)
+        else:
+            img.save(path, "JPEG")
+    elif kind == "gif":
+        img.convert("P").save(path, "GIF")
+    elif kind == "png":
+        img.save(path, "PNG")
+    else:
+        img.save(path, "BMP")
+
+def write_video(path, kind, rng, payload_size):
+    """Write a minimal but well formed container header followed by padding."""
+    width, height = rng.choice([(640, 480), (1280, 720), (1920, 1080), (3840, 2160)])
+    duration = rng.uniform(1, 600)
+    created = rng.randint(946684800, 1735689600)  # 2000 to 2025
+    payload = b"\x00" * payload_size
+
+    if kind in ("mp4", "mov"):
+        data = _bmff_video(kind, width, height, duration, created, payload)
+    elif kind == "mkv":
+        data = _matroska_video(width, height, duration, created, payload)
+    else:
+        data = _avi_video(width, height, duration, payload)
+
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+def _bmff_video(kind, width, height, duration, created, payload):
+    brand = b"qt  " if kind == "mov" else b"isom"
+    ftyp = _box(b"ftyp", brand + b"\x00\x00\x00\x00" + brand)
+
+    timescale = 1000
+    mvhd = _box(b"mvhd", b"\x00\x00\x00\x00" + struct.pack(
+        ">IIII", created + 2082844800, created + 2082844800, timescale, int(duration * timescale)
+    ) + b"\x00" * 80)
+    tkhd = _box(b"tkhd", b"\x00\x00\x00\x07" + b"\x00" * 72 + struct.pack(">II", width << 16, height << 16))
+    moov = _box(b"moov", mvhd + _box(b"trak", tkhd))
+
+    # Put moov after the frame data as many cameras do
+    return ftyp + _box(b"mdat", payload) + moov
+
+def _ebml(element_id, data):
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    return id_bytes + b"\x01" + len(data).to_bytes(7, "big") + data
+
+def _matroska_video(width, height, duration, created, payload):
+    header = _ebml(0x1A45DFA3, _ebml(0x4282, b"matroska"))
+    info = _ebml(0x1549A966,
+                 _ebml(0x2AD7B1, (1000000).to_bytes(3, "big"))
+                 + _ebml(0x4489, struct.pack(">d", duration * 1000))
+                 + _ebml(0x4461, ((created - 978307200) * 10**9).to_bytes(8, "big", signed=True)))
+    video = _ebml(0xE0, _ebml(0xB0, width.to_bytes(2, "big")) + _ebml(0xBA, height.to_bytes(2, "big")))
+    tracks = _ebml(0x1654AE6B, _ebml(0xAE, _ebml(0xD7, b"\x01") + video))
+    cluster = _ebml(0x1F43B675, payload)
+    return header + _ebml(0x18538067, info + tracks + cluster)
+
+def _avi_video(width, height, duration, payload):
+    fps = 25
+    avih = struct.pack("<10I", 1000000 // fps, 0, 0, 0, int(duration * fps), 0, 1, 0, width, height) + b"\x00" * 16
+    hdrl = b"hdrl" + b"avih" + struct.pack("<I", len(avih)) + avih
+    movi = b"movi" + payload
+    body = b"AVI " + b"LIST" + struct.pack("<I", len(hdrl)) + hdrl + b"LIST" + struct.pack("<I", len(movi)) + movi
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", help="folder to write the library into")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size-mix", type=json.loads, default=None,
+                        help='JSON weights, e.g. \'{"small": 0.9, "large": 0.1}\'')
+    parser.add_argument("--exif-fraction", type=float, default=0.5)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--video-fraction", type=float, default=0.1)
+    args = parser.parse_args()
+
+    paths = generate_library(args.output, args.count, args.seed, args.size_mix,
+                             args.exif_fraction, args.depth, args.fanout, args.video_fraction)
+    print(f"Wrote {len(paths)} files to {args.output}")
+
+if __name__ == "__main__":
+    main()
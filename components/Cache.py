@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import hashlib
+import json
+import sys
+import threading
+
+class QueryCache:
+    """
+    Least recently used cache of query results with a size budget in bytes.
+
+    Every lookup passes the current write generation of the database. When
+    it differs from the generation the entries were stored under, the whole
+    cache is dropped, since any write can change any result. A result read
+    under another generation than the cache's is not stored, so a slow
+    reader cannot roll the cache back to a generation that has passed.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.size = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        """Return the cached value for key, or None on a miss."""
+        with self.lock:
+            self.check_generation(generation)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, generation):
+        size = estimate_size(value, self.max_bytes)
+        with self.lock:
+            if generation != self.generation or size > self.max_bytes:
+                return
+
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.entries[key] = (value, size)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def check_generation(self, generation):
+        if generation != self.generation:
+            self.entries.clear()
+            self.size = 0
+            self.generation = generation
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self.entries), "bytes": self.size}
+
+def make_key(*parts):
+    """Hash JSON-able parts into a key that is the same however dicts are ordered."""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+def estimate_size(value, limit=None):
+    """
+    Rough size in bytes of a query result made of lists, tuples, dicts and scalars.
+
+    Parameters:
+        limit (int | None): Stop counting once the size passes this, since a
+            result too big to cache does not need an exact size.
+
+    Returns:
+        int: The size, or a size over limit if it was passed.
+    """
+    size = 0
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        size += sys.getsizeof(value)
+        if limit is not None and size > limit:
+            break
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return size
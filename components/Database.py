@@ -1,67 +1,589 @@
 
 from pathlib import Path
+import itertools
+import json
+import os
 import sqlite3
-from datetime import datetime
-from PIL import Image
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import heapq
+import queue
+import threading
 import time
 
-from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+from PyQt5.QtCore import QObject, QMetaObject, QThread, QTimer, Qt, pyqtSignal, pyqtSlot
+
+from components.Cache import QueryCache, make_key
+from components.Filters import (
+    FilterCompiler, FACET_COLUMNS, FACET_RANGE_COLUMNS, MEDIA_TAGS_SELECT, TAG_CONDITIONS
+)
+from components.Requests import DatabaseRequest
+from components.TagIndex import TagIndex
+from components.WriteBuffer import WriteBuffer
+from components.Scanner import (
+    iter_media_files, iter_media_directories, iter_chunks, try_extract_metadata, extract_metadata_batch
+)
 
 DB_PATH = "../database.db"
 MEDIA_PATH = Path.cwd() / "../media"
+BATCH_SIZE = 500  # rows written per ingest transaction
+PAGE_SIZE = 30  # rows per gallery page
+STREAM_CHUNK_SIZE = 200  # rows per chunk when results are streamed
+FILTER_CACHE_BYTES = 32 * 1024 * 1024  # memory budget for cached filter results
+READ_POOL_SIZE = 4  # read-only connections shared by query methods
+READ_THREADS = 3  # threads running read methods, each borrowing its own pooled connection
+STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
+WRITE_BEHIND_MS = 250  # how long small row writes are held to be committed together
+
+# Scheduling lanes for DatabaseWorker tasks, most urgent first
+LANE_INTERACTIVE = 0  # reads the user is waiting on
+LANE_WRITE = 1  # edits the user made
+LANE_BACKGROUND = 2  # long maintenance jobs, which yield to the lanes above between batches
+
+# Lane of every method that is not an interactive read
+METHOD_LANES = {
+    "populate_media": LANE_BACKGROUND,
+    "rescan": LANE_BACKGROUND,
+    "refresh_database": LANE_BACKGROUND,
+    "run_index_job": LANE_BACKGROUND,
+    "toggle_favourite": LANE_WRITE,
+    "set_image_filename": LANE_WRITE,
+    "set_image_tags": LANE_WRITE,
+    "add_tag": LANE_WRITE,
+    "add_tags_to_image": LANE_WRITE,
+    "add_tag_to_images": LANE_WRITE,
+    "rename_tag": LANE_WRITE,
+    "remove_tag_by_name": LANE_WRITE,
+    "clear_table": LANE_WRITE,
+    "delete_media_table": LANE_WRITE,
+    "run_batch": LANE_WRITE,
+    # Small rescans from the watcher. run_index_job calls it directly, so
+    # this lane only applies to requests, which then run between the job's batches
+    "rescan_directories": LANE_WRITE,
+}
+
+# Write lane methods that reads do not queue behind. They pick up changes
+# made on disk, not edits the user is waiting to see
+UNORDERED_WRITES = {"rescan_directories"}
+
+# Small writes to one media row, given by the first argument. These are
+# buffered and committed together, see WriteBuffer
+WRITE_BEHIND_METHODS = {"toggle_favourite", "set_image_filename", "set_image_tags"}
+
+# Methods that only query the read-only connections. These run on the read
+# threads, side by side, instead of queueing behind the writer
+READ_METHODS = {
+    "apply_filters", "iter_filtered", "get_filtered_page", "count_filtered", "get_facets",
+    "get_first_media", "get_media_count", "get_media_count_by_type", "get_highest_id",
+    "get_unique_values", "get_all_tags", "get_duplicates", "get_cache_stats",
+    "get_unfinished_index_job",
+}
+
+# Applied to every connection. WAL lets readers run alongside the single writer.
+CONNECTION_PRAGMAS = [
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -65536",  # 64 MiB
+    "PRAGMA mmap_size = 268435456",  # 256 MiB
+    "PRAGMA temp_store = MEMORY",
+]
+WRITER_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+]
+
+# Columns added after the first release, as (name, definition)
+MEDIA_COLUMN_MIGRATIONS = [
+    ("mtime", "INTEGER"),
+    ("content_hash", "TEXT"),
+    ("duration", "REAL"),
+    # Dates as epoch seconds, derived by SQLite so every write keeps them in sync
+    ("date_captured_ts", "INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', date_captured) AS INTEGER)) VIRTUAL"),
+    ("date_added_ts", "INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', date_added) AS INTEGER)) VIRTUAL"),
+]
+
+# Secondary indexes, one per filterable or sortable column
+MEDIA_INDEXES = {
+    "idx_media_content_hash": "media(content_hash)",
+    "idx_media_filename": "media(filename)",
+    "idx_media_type": "media(type)",
+    "idx_media_format": "media(format)",
+    "idx_media_camera_model": "media(camera_model)",
+    "idx_media_is_favourite": "media(is_favourite)",
+    "idx_media_filesize": "media(filesize)",
+    "idx_media_width": "media(width)",
+    "idx_media_height": "media(height)",
+    "idx_media_times_viewed": "media(times_viewed)",
+    "idx_media_time_viewed": "media(time_viewed)",
+    "idx_media_duration": "media(duration)",
+    "idx_media_date_captured_ts": "media(date_captured_ts)",
+    "idx_media_date_added_ts": "media(date_added_ts)",
+    "idx_media_tags_tag": "media_tags(tag_id, media_id)",
+}
+
+# Trigram full text index over filenames, kept in sync with media by triggers
+MEDIA_FTS_TRIGGERS = {
+    "media_fts_insert": """
+        AFTER INSERT ON media BEGIN
+            INSERT INTO media_fts (rowid, filename) VALUES (new.id, new.filename);
+        END
+    """,
+    "media_fts_delete": """
+        AFTER DELETE ON media BEGIN
+            INSERT INTO media_fts (media_fts, rowid, filename) VALUES ('delete', old.id, old.filename);
+        END
+    """,
+    "media_fts_update": """
+        AFTER UPDATE OF filename ON media BEGIN
+            INSERT INTO media_fts (media_fts, rowid, filename) VALUES ('delete', old.id, old.filename);
+            INSERT INTO media_fts (rowid, filename) VALUES (new.id, new.filename);
+        END
+    """,
+}
+
+class IndexCancelled(Exception):
+    pass
 
 class DatabaseWorker(QObject):
-    results_ready = pyqtSignal(str, object, object) # method_name, result, context
-    error = pyqtSignal(str, str, object)            # method_name, error_message, context
+    progress = pyqtSignal(str, object)  # method_name, stats
+    request_chunk = pyqtSignal(object, int, object)  # DatabaseRequest, sequence, rows
+    request_finished = pyqtSignal(object)  # DatabaseRequest
 
     def __init__(self, db_path):
         super().__init__()
+        # Connected before the worker moves to its thread, so futures are
+        # settled on the thread that created it, which is where they live
+        self.request_chunk.connect(lambda request, sequence, rows: request.future.deliver_chunk(sequence, rows))
+        self.request_finished.connect(lambda request: request.future.settle())
+
         self.db_path = db_path
         self.db = None
+        self.db_lock = threading.Lock()
+        self.closed = False  # set by shutdown, requests submitted after it are cancelled
+
+        # Read methods run here, every other method on the thread this worker lives on
+        self.read_executor = ThreadPoolExecutor(READ_THREADS, thread_name_prefix="db-read")
+
+        # Supersession. A ticket is (key, token) and only the newest token
+        # issued for a key is current, older requests with that key are dropped
+        self.latest_tokens = {}
+        self.tokens = itertools.count(1)
+        self.running = {}  # thread id -> DatabaseRequest that thread is running
+        self.ticket_lock = threading.Lock()
+
+        # Queued requests as (lane, sequence, request). The sequence keeps
+        # requests in a lane first in, first out
+        self.tasks = []
+        self.task_seq = itertools.count()
+        self.task_lock = threading.Lock()
+        self.current_lane = None  # lane of the request running, None when idle
+        self.writes_pending = 0  # requests in the write lane queued or running
+
+        # Write-behind. The timer stays on the thread that made the worker,
+        # which is the one that submits, so the flush is queued like any request
+        self.write_buffer = WriteBuffer(WRITE_BEHIND_METHODS)
+        self.flush_timer = QTimer()
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(lambda: self.flush_writes())
 
     @pyqtSlot()
     def init_db(self):
-        if self.db is None:
-            self.db = MediaDatabase(self.db_path)
+        with self.db_lock:
+            if self.db is None:
+                db = MediaDatabase(self.db_path)
+                # Opened and migrated before any thread can see db, so only
+                # one writer is made and no query runs against an old schema
+                db.create_tables()
+                db.record_data_version()
+                self.db = db
+
+    def shutdown(self):
+        """
+        Commit the buffered writes and run the other queued writes, cancelling
+        queued background jobs, then stop the read threads, abandoning the
+        reads still queued, and close the database. Called from the GUI thread.
+        """
+        self.flush_writes()
+        # Slots of the requests drained below may submit follow up work, which is cancelled
+        self.closed = True
+        if self.thread() is QThread.currentThread():
+            self.drain()
+        else:
+            QMetaObject.invokeMethod(self, "drain", Qt.BlockingQueuedConnection)
+
+        if self.db is not None:
+            self.db.interrupt_reads()
+        self.read_executor.shutdown(wait=True, cancel_futures=True)
+
+        # Nothing is running now, so close, which also refreshes the planner statistics
+        with self.db_lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    @pyqtSlot()
+    def drain(self):
+        while self.run_next():
+            pass
+
+    def flush_writes(self):
+        """
+        Send the buffered writes as one run_batch request. Called from the GUI thread.
+
+        Returns:
+            RequestFuture | None: The batch's future, or None if nothing was buffered.
+        """
+        self.flush_timer.stop()
+        calls, merged = self.write_buffer.take()
+        if not calls:
+            return None
+        batch = DatabaseRequest("run_batch", (calls,), lane=LANE_WRITE)
+        batch.merged = merged
+        print(f"[QUERY] Flushing {len(merged)} buffered writes as {len(calls)}")
+        return self.submit(batch)
+
+    def submit(self, request):
+        """
+        Queue a request and wake the worker thread to run it, or hand a read
+        method to the read threads. Called from the GUI thread.
 
-    @pyqtSlot(str, object, object, object)
-    def run_task(self, method_name, args=(), kwargs=None, context=None):
+        Returns:
+            RequestFuture: The request's future.
+        """
+        request.submitted = time.perf_counter()
+        request.future.worker = self
+
+        if self.closed:
+            # Settled from the event loop, once the caller has connected to the future
+            request.cancelled = True
+            request.status = "cancelled"
+            QTimer.singleShot(0, request.future.settle)
+            return request.future
+
+        # Small row writes wait in the buffer. Any other request flushes it
+        # first, so reads see those writes and later writes land after them
+        if self.write_buffer.accepts(request):
+            if self.write_buffer.add(request):
+                self.flush_timer.start(WRITE_BEHIND_MS)
+            return request.future
+        if self.write_buffer:
+            self.flush_writes()
+
+        lane = request.lane
+        if lane is None:
+            lane = METHOD_LANES.get(request.method_name, LANE_INTERACTIVE)
+
+        with self.task_lock:
+            # A read must see the edits the user made before it, so it waits
+            # behind them on the writer thread instead of overtaking them
+            if lane == LANE_INTERACTIVE and self.writes_pending:
+                lane = LANE_WRITE
+            elif lane == LANE_INTERACTIVE and request.method_name in READ_METHODS:
+                self.read_executor.submit(self.run_request, request)
+                return request.future
+
+            if self.orders_reads(lane, request):
+                self.writes_pending += 1
+            heapq.heappush(self.tasks, (lane, next(self.task_seq), request))
+
+        # One wake up per request, each runs whichever request is most urgent by then
+        QMetaObject.invokeMethod(self, "process_next", Qt.QueuedConnection)
+        return request.future
+
+    @pyqtSlot()
+    def process_next(self):
+        self.run_next()
+
+    def run_next(self, below_lane=None):
+        """
+        Run the most urgent queued request, if it is in a lane more urgent than below_lane.
+
+        Returns:
+            bool: Whether a request ran.
+        """
+        with self.task_lock:
+            if not self.tasks or (below_lane is not None and self.tasks[0][0] >= below_lane):
+                return False
+            lane, _, request = heapq.heappop(self.tasks)
+
+        if self.closed and lane == LANE_BACKGROUND:
+            # Background jobs are not worth keeping the window waiting for
+            # on shutdown. An index job resumes from its checkpoints next launch
+            request.cancelled = True
+            self.finish_request(request, "cancelled")
+            return True
+
+        outer_lane = self.current_lane
+        self.current_lane = lane
         try:
-            if self.db is None:
-                self.init_db()
+            self.run_request(request)
+        finally:
+            self.current_lane = outer_lane
+            if self.orders_reads(lane, request):
+                with self.task_lock:
+                    self.writes_pending -= 1
+        return True
+
+    def orders_reads(self, lane, request):
+        """Whether reads submitted while this request is pending wait for it."""
+        return lane == LANE_WRITE and request.method_name not in UNORDERED_WRITES
+
+    def yield_to_urgent(self):
+        """
+        Run every queued request more urgent than the one running. Long jobs
+        call this between batches, so interactive work waits for at most one batch.
+        """
+        if self.current_lane is None:
+            return
+        while self.run_next(below_lane=self.current_lane):
+            pass
 
-            if not hasattr(self.db, method_name):
-                raise AttributeError(f"MediaDatabase has no method '{method_name}'")
+    def supersede(self, key):
+        """
+        Issue a ticket for a new request with this key, making every older
+        request with the same key stale. A stale request still queued is
+        skipped and a running one has its query interrupted. Called from the GUI thread.
+
+        Returns:
+            tuple: The ticket for the new DatabaseRequest.
+        """
+        with self.ticket_lock:
+            token = next(self.tokens)
+            self.latest_tokens[key] = token
+            threads = {thread for thread, running in self.running.items()
+                       if running is not None and running.ticket and running.ticket[0] == key}
+            if threads and self.db is not None:
+                self.db.interrupt_reads(threads)
+        return (key, token)
+
+    def cancel(self, request):
+        """
+        Interrupt the request's query if it is running. Called by RequestFuture.cancel.
+        A buffered write is dropped along with the writes it replaced, which
+        never reached the database either.
+        """
+        for replaced in self.write_buffer.discard(request):
+            if replaced is not request:
+                replaced.future.cancel()
+
+        with self.ticket_lock:
+            request.cancelled = True
+            threads = {thread for thread, running in self.running.items() if running is request}
+            if threads and self.db is not None:
+                self.db.interrupt_reads(threads)
+
+    def is_stale(self, request):
+        if request.cancelled:
+            return True
+        if request.ticket is None:
+            return False
+        key, token = request.ticket
+        return self.latest_tokens.get(key) != token
+
+    def start_request(self, request):
+        """
+        Mark the request as running, or return False if it has been superseded or cancelled.
+
+        Returns:
+            tuple | bool: (True, previous request) or False. The previous request
+                is the one this one interrupted, if it runs nested in
+                yield_to_urgent, and is restored by finish_request.
+        """
+        thread = threading.get_ident()
+        with self.ticket_lock:
+            if self.is_stale(request):
+                return False
+            previous = self.running.get(thread)
+            self.running[thread] = request
+            request.status = "running"
+            request.started = time.perf_counter()
+            return (True, previous)
+
+    def finish_request(self, request, status, previous=None):
+        """Record how the request ended and settle its future on the thread that owns it."""
+        with self.ticket_lock:
+            if request.started is not None:
+                self.running[threading.get_ident()] = previous
+            # A request superseded or cancelled while it ran is cancelled whatever its outcome
+            request.status = "cancelled" if self.is_stale(request) else status
+            request.finished = time.perf_counter()
+        print(f"[QUERY] {request.status.capitalize()}: {request.method_name} ({request.timing()})")
+        self.request_finished.emit(request)
+
+    def run_request(self, request):
+        if request.stream:
+            self.run_stream(request)
+        else:
+            self.run_task(request)
 
-            if kwargs is None:
-                kwargs = {}
+    def run_task(self, request):
+        started = self.start_request(request)
+        if not started:
+            self.finish_request(request, "cancelled")
+            return
 
-            method = getattr(self.db, method_name)
-            result = method(*args, **kwargs)
-            print(f"[QUERY] Emit results for: {method_name}")
-            self.results_ready.emit(method_name, result, context)
+        status = "failed"
+        callbacks = None
+        try:
+            method = self.get_method(request.method_name)
+            # Read methods never report progress and run on several threads
+            # at once, so only the writer thread's requests set the callbacks.
+            # They are saved and restored, a request can run nested inside a job it interrupted
+            if request.method_name not in READ_METHODS:
+                self.db.record_data_version()
+                callbacks = (self.db.progress_callback, self.db.yield_callback)
+                self.db.progress_callback = lambda stats: self.progress.emit(request.method_name, stats)
+                self.db.yield_callback = self.yield_to_urgent
+            request.result = method(*request.args, **request.kwargs)
+            status = "done"
 
         except Exception as e:
-            self.error.emit(method_name, str(e), context)
+            # A superseded query fails with "interrupted", which nobody is waiting for
+            request.error = str(e)
+
+        finally:
+            if callbacks is not None:
+                self.db.progress_callback, self.db.yield_callback = callbacks
+            self.finish_request(request, status, started[1])
+
+    def run_stream(self, request):
+        """
+        Run a MediaDatabase method that yields its results in chunks, passing
+        each chunk to the future as soon as it is read. A superseded or
+        cancelled stream stops between chunks. The result is the chunk count.
+        """
+        started = self.start_request(request)
+        if not started:
+            self.finish_request(request, "cancelled")
+            return
+
+        status = "failed"
+        chunks = None
+        sequence = 0
+        try:
+            method = self.get_method(request.method_name)
+            chunks = method(*request.args, **request.kwargs)
+            for chunk in chunks:
+                if self.is_stale(request):
+                    break
+                self.request_chunk.emit(request, sequence, chunk)
+                sequence += 1
+            request.result = sequence
+            status = "done"
+
+        except Exception as e:
+            request.error = str(e)
+
+        finally:
+            if chunks is not None and hasattr(chunks, "close"):
+                chunks.close()  # release the read connection if the stream stopped early
+            self.finish_request(request, status, started[1])
+
+    def get_method(self, method_name):
+        if self.db is None:
+            self.init_db()
+
+        if not hasattr(self.db, method_name):
+            raise AttributeError(f"MediaDatabase has no method '{method_name}'")
+
+        return getattr(self.db, method_name)
 
 
 class MediaDatabase:
     def __init__(self, db_path=DB_PATH, media_path=MEDIA_PATH):
         self.db_path = db_path
-        self.media_path = media_path
-        self.conn = None  # connection created lazily
+        self.media_path = media_path  # a single root or a list of roots
+        self.conn = None  # writer connection, created lazily
+        self.progress_callback = None  # called with a stats dict during ingest
+        self.yield_callback = None  # called between ingest batches to let urgent tasks run
+        self.batch_depth = 0  # while above 0, commits wait for run_batch to finish
+        self.fts_available = None  # whether media_fts exists, checked on first search
+        self.write_generation = 0  # bumped by every commit on the writer connection
+        self.data_version = None  # the writer connection's PRAGMA data_version, see record_data_version
+        self.filter_cache = QueryCache(FILTER_CACHE_BYTES)
+        self.tag_index = TagIndex()  # loaded on the first tag filter
+        self.filter_compiler = FilterCompiler()
+
+        # Read-only connections, created on demand up to READ_POOL_SIZE
+        self.read_pool = queue.Queue()
+        self.read_conns = []
+        self.read_lock = threading.Lock()
+        self.active_reads = {}  # read connection currently borrowed -> id of the thread using it
 
     def get_conn(self):
-        """Always return a valid sqlite connection bound to the worker thread."""
+        """Always return the writer connection. All writes go through this one connection."""
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                        cached_statements=STATEMENT_CACHE_SIZE)
+            for pragma in WRITER_PRAGMAS + CONNECTION_PRAGMAS:
+                self.conn.execute(pragma)
         return self.conn
 
     def get_cursor(self):
         """Shortcut to always get a cursor from a valid connection."""
         return self.get_conn().cursor()
 
+    @contextmanager
+    def read_cursor(self):
+        """
+        Borrow a cursor on a read-only pooled connection.
+
+        In WAL mode these see the last committed state and are not blocked by
+        a write in progress on the writer connection, or in another process.
+        """
+        conn = self.acquire_read_conn()
+        with self.read_lock:
+            self.active_reads[conn] = threading.get_ident()
+        try:
+            yield conn.cursor()
+        finally:
+            with self.read_lock:
+                self.active_reads.pop(conn, None)
+            self.read_pool.put(conn)
+
+    def interrupt_reads(self, threads=None):
+        """
+        Abort the queries running on borrowed read connections. Thread safe.
+
+        Parameters:
+            threads (set | None): Only abort the reads of these thread ids, or every read when None.
+        """
+        with self.read_lock:
+            for conn, thread in self.active_reads.items():
+                if threads is None or thread in threads:
+                    conn.interrupt()
+
+    def acquire_read_conn(self):
+        try:
+            return self.read_pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.read_lock:
+            if len(self.read_conns) < READ_POOL_SIZE:
+                # Make sure the file exists and is in WAL mode before opening it read-only
+                self.get_conn()
+                uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                       cached_statements=STATEMENT_CACHE_SIZE)
+                for pragma in CONNECTION_PRAGMAS:
+                    conn.execute(pragma)
+                self.read_conns.append(conn)
+                return conn
+
+        return self.read_pool.get()
+
     def close(self):
+        if self.conn:
+            # Refresh planner statistics for the indexes, cheap when nothing changed
+            self.conn.execute("PRAGMA optimize")
+
+        with self.read_lock:
+            for conn in self.read_conns:
+                conn.close()
+            self.read_conns = []
+            self.read_pool = queue.Queue()
+
         if self.conn:
             self.conn.close()
             self.conn = None
@@ -69,8 +591,10 @@ class MediaDatabase:
     def delete_media_table(self):
         cursor = self.get_cursor()
         try:
+            cursor.execute("DROP TABLE IF EXISTS media_fts")
             cursor.execute("DROP TABLE IF EXISTS media")
-            self.get_conn().commit()
+            self.commit()
+            self.tag_index.reset()
         except sqlite3.Error as e:
             print(f"Error deleting media table: {e}")
 
@@ -79,7 +603,8 @@ class MediaDatabase:
         cursor.execute(f"DELETE FROM {table_name}")
         if reset_id:
             cursor.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table_name,))
-        self.get_conn().commit()
+        self.commit()
+        self.tag_index.reset()
 
     def remove_tag_by_name(self, tag_name):
         cursor = self.get_cursor()
@@ -92,7 +617,8 @@ class MediaDatabase:
         cursor.execute("DELETE FROM media_tags WHERE tag_id = ?", (tag_id,))
         cursor.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
 
-        self.get_conn().commit()
+        self.commit()
+        self.tag_index.remove_tag(tag_id, tag_name)
         return True
 
     def rename_tag(self, old_name, new_name):
@@ -111,7 +637,8 @@ class MediaDatabase:
 
         cursor.execute("UPDATE tags SET name = ? WHERE id = ?", (new_name, tag_id))
 
-        self.get_conn().commit()
+        self.commit()
+        self.tag_index.rename_tag(tag_id, old_name, new_name)
         return True
 
     def create_tables(self):
@@ -132,7 +659,10 @@ class MediaDatabase:
             times_viewed INTEGER DEFAULT 0,
             time_viewed INTEGER DEFAULT 0,
             date_captured TEXT,
-            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            mtime INTEGER,
+            content_hash TEXT,
+            duration REAL
         );
         """)
 
@@ -153,120 +683,699 @@ class MediaDatabase:
         );
         """)
 
-        self.get_conn().commit()
+        self.add_missing_columns(cursor)
+
+        for index_name, target in MEDIA_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {target}")
+
+        self.create_fts(cursor)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS index_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT CHECK(status IN ('running', 'paused', 'cancelled', 'done')) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+
+        # Directories an index job has finished, so it can resume after them
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS index_job_dirs (
+            job_id INTEGER NOT NULL,
+            directory TEXT NOT NULL,
+            PRIMARY KEY (job_id, directory),
+            FOREIGN KEY (job_id) REFERENCES index_jobs(id) ON DELETE CASCADE
+        );
+        """)
+
+        self.commit()
+
+    def add_missing_columns(self, cursor):
+        """Bring databases created by older versions up to the current media schema."""
+        cursor.execute("PRAGMA table_xinfo(media)")
+        existing = {row[1] for row in cursor.fetchall()}
+
+        for column, definition in MEDIA_COLUMN_MIGRATIONS:
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE media ADD COLUMN {column} {definition}")
+                if column == "duration":
+                    # Videos were stored without container metadata, have the next rescan re-read them
+                    cursor.execute("UPDATE media SET mtime = NULL WHERE type = 'video'")
+
+    def create_fts(self, cursor):
+        """Create the filename search index, filling it from media the first time."""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_fts'")
+        exists = cursor.fetchone() is not None
+
+        try:
+            cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts5(
+                filename,
+                content='media', content_rowid='id', tokenize='trigram', detail='none'
+            );
+            """)
+        except sqlite3.OperationalError as e:
+            # SQLite older than 3.34 or built without FTS5, name search falls back to LIKE
+            print(f"Filename search index unavailable: {e}")
+            return
+
+        for trigger_name, body in MEDIA_FTS_TRIGGERS.items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {body}")
+
+        if not exists:
+            cursor.execute("INSERT INTO media_fts (media_fts) VALUES ('rebuild')")
+
+    def has_fts(self):
+        if self.fts_available is None:
+            with self.read_cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_fts'")
+                self.fts_available = cursor.fetchone() is not None
+        return self.fts_available
 
     def refresh_database(self):
         cursor = self.get_cursor()
 
         try:
+            cursor.execute("DROP TABLE IF EXISTS media_fts")
             cursor.execute("DROP TABLE IF EXISTS media_tags")
             cursor.execute("DROP TABLE IF EXISTS tags")
             cursor.execute("DROP TABLE IF EXISTS media")
-            self.get_conn().commit()
+            self.commit()
+            self.tag_index.reset()
         except sqlite3.Error as e:
             print(f"Error dropping tables: {e}")
 
         self.create_tables()
         self.populate_media()
 
-    def populate_media(self):
+    def populate_media(self, workers=1, batch_size=BATCH_SIZE):
+        """
+        Scan the media roots recursively and insert a row for every supported file.
+
+        Parameters:
+            workers (int | None): Processes used for metadata extraction.
+                1 extracts on this thread, None uses one per CPU.
+            batch_size (int): Rows written per transaction.
+        """
+        progress = self.start_progress()
+
+        rows = self.extract_all(iter_media_files(self.media_path), workers, progress)
+        for batch in iter_chunks(rows, batch_size):
+            progress["scanned"] += len(batch)
+            self.insert_media_rows(batch, progress)
+            self.report_progress(progress)
+
+        return progress
+
+    def rescan(self, workers=1, batch_size=BATCH_SIZE):
+        """
+        Bring the media table in line with the media roots without a full rebuild.
+
+        Unchanged files (same size and mtime) are skipped, modified files are
+        re-read in place so their tags and view stats survive, new files are
+        inserted and rows whose file has disappeared are removed. A new file
+        whose content hash matches a row whose file has gone is treated as a
+        move or rename and that row's path is updated instead.
+
+        Returns:
+            dict: Counts of added, updated, moved, removed and unchanged files.
+        """
         cursor = self.get_cursor()
-        supported_exts = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.mp4', '.avi', '.mov', '.mkv'}
+        cursor.execute("SELECT filepath, id, filesize, mtime, content_hash, filename FROM media")
+        known = {row[0]: row[1:] for row in cursor.fetchall()}
 
-        media_dir = Path(self.media_path)
+        return self.sync_media(iter_media_files(self.media_path), known, workers, batch_size)
 
-        for file in media_dir.iterdir():
-            if not file.is_file():
-                continue
-            if file.suffix.lower() not in supported_exts:
+    def rescan_directories(self, directories, workers=1, batch_size=BATCH_SIZE, executor=None):
+        """
+        Incrementally rescan only the files directly inside the given directories.
+
+        Used for small jobs such as those from the filesystem watcher, where
+        walking every root would be wasteful. A directory that no longer
+        exists has all of its rows removed.
+
+        Parameters:
+            executor (ProcessPoolExecutor | None): A pool shared by a longer
+                job, used instead of starting one for these directories.
+
+        Returns:
+            dict: The same counts as rescan.
+        """
+        cursor = self.get_cursor()
+        # Paths must be spelt the way the walker builds them to match stored rows
+        directories = {str(directory).rstrip("/\\") or str(directory) for directory in directories}
+
+        known = {}
+        for directory in directories:
+            # A range over the filepath UNIQUE index instead of a LIKE scan
+            prefix = os.path.join(directory, "")
+            cursor.execute("""
+                SELECT filepath, id, filesize, mtime, content_hash, filename
+                FROM media
+                WHERE filepath >= ? AND filepath < ?
+            """, (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+            for row in cursor.fetchall():
+                if os.path.dirname(row[0]) == directory:
+                    known[row[0]] = row[1:]
+
+        media_files = (
+            media_file
+            for directory in sorted(directories) if os.path.isdir(directory)
+            for media_file in iter_media_files(directory, recursive=False)
+        )
+        return self.sync_media(media_files, known, workers, batch_size, executor)
+
+    def sync_media(self, media_files, known, workers=1, batch_size=BATCH_SIZE, executor=None):
+        """
+        Reconcile the files found on disk with the rows previously stored for them.
+
+        Parameters:
+            media_files (iterable): MediaFile candidates found by the walker.
+            known (dict): filepath -> (id, filesize, mtime, content_hash, filename)
+                for every row the walk is expected to cover. Rows left over
+                once the walk ends are deleted.
+        """
+        summary = {"added": 0, "updated": 0, "moved": 0, "removed": 0, "unchanged": 0}
+        progress = self.start_progress(total=len(known))
+        modified = set()
+
+        def changed_files():
+            for media_file in media_files:
+                progress["scanned"] += 1
+                row = known.pop(media_file.path, None)
+                if row is None:
+                    yield media_file
+                # Rows from before content hashing are re-read once to fill it in
+                elif row[1] == media_file.size and row[2] == media_file.mtime_ns and row[3]:
+                    summary["unchanged"] += 1
+                    if progress["scanned"] % batch_size == 0:
+                        self.report_progress(progress)
+                else:
+                    modified.add(media_file.path)
+                    yield media_file
+
+        lookup = self.get_cursor()
+
+        def moved_from(row):
+            # The old file may not have been reached by the walk yet, so
+            # check the disk rather than wait for the walk to finish
+            if row[11] is None:
+                return None
+            lookup.execute("SELECT id, filepath FROM media WHERE content_hash = ?", (row[11],))
+            for media_id, old_path in lookup.fetchall():
+                if old_path not in moved_paths and not os.path.exists(old_path):
+                    return media_id, old_path
+            return None
+
+        moved_paths = set()
+        for batch in iter_chunks(self.extract_all(changed_files(), workers, progress, executor), batch_size):
+            updates, moves, inserts = [], [], []
+            for row in batch:
+                if row[0] in modified:
+                    updates.append(row)
+                elif (match := moved_from(row)) is not None:
+                    media_id, old_path = match
+                    known.pop(old_path, None)
+                    moved_paths.add(old_path)
+                    moves.append((row, media_id, old_path))
+                else:
+                    inserts.append(row)
+
+            self.update_media_rows(updates, progress)
+            self.move_media_rows(moves, progress)
+            self.insert_media_rows(inserts, progress)
+            summary["updated"] += len(updates)
+            summary["moved"] += len(moves)
+            summary["added"] += len(inserts)
+            self.report_progress(progress)
+
+        # Anything left in known was not found on disk
+        missing_ids = [(row[0],) for row in known.values()]
+        self.delete_media_rows(missing_ids)
+        summary["removed"] = len(missing_ids)
+
+        self.report_progress(progress)
+        return summary
+
+    def start_index_job(self):
+        """
+        Resume the latest unfinished index job, or create a new one.
+
+        Returns:
+            tuple: (job_id, set of directories already indexed by the job).
+        """
+        job_id = self.get_unfinished_index_job()
+        cursor = self.get_cursor()
+        if job_id is None:
+            cursor.execute("INSERT INTO index_jobs (status) VALUES ('running')")
+            job_id = cursor.lastrowid
+
+        self.set_index_job_status(job_id, "running")
+
+        cursor.execute("SELECT directory FROM index_job_dirs WHERE job_id = ?", (job_id,))
+        return job_id, {row[0] for row in cursor.fetchall()}
+
+    def get_unfinished_index_job(self):
+        with self.read_cursor() as cursor:
+            cursor.execute("""
+                SELECT id FROM index_jobs
+                WHERE status IN ('running', 'paused')
+                ORDER BY id DESC LIMIT 1
+            """)
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def run_index_job(self, workers=None, should_stop=None):
+        """
+        Run a full incremental index of the media roots as a resumable job.
+
+        The job works through one directory at a time and checkpoints each one
+        once it is synced, so a paused, cancelled or killed job picks up after
+        the last finished directory. Progress is reported for the whole job.
+
+        Parameters:
+            workers (int | None): Processes used for metadata extraction,
+                shared by every directory of the job. None uses one per CPU.
+            should_stop (callable | None): Returns None to carry on, or
+                "paused" or "cancelled" to stop after the current batch.
+
+        Returns:
+            tuple: (final status, summary of added, updated, moved, removed and unchanged).
+        """
+        self.create_tables()
+        job_id, done_dirs = self.start_index_job()
+        totals = {"scanned": 0, "inserted": 0, "updated": 0, "failed": 0}
+        summary = {"added": 0, "updated": 0, "moved": 0, "removed": 0, "unchanged": 0}
+        total = self.get_media_count()
+        started = time.perf_counter()
+
+        def stop_status():
+            return should_stop() if should_stop is not None else None
+
+        report = self.progress_callback
+
+        def on_progress(stats):
+            if stop_status() is not None:
+                raise IndexCancelled()
+            combined = dict(stats)
+            for key in totals:
+                combined[key] = totals[key] + stats[key]
+            combined["total"] = total
+            combined["elapsed"] = time.perf_counter() - started
+            if combined["elapsed"] > 0:
+                combined["rate"] = combined["scanned"] / combined["elapsed"]
+            if report is not None:
+                report(combined)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        self.progress_callback = on_progress
+        status = "done"
+        executor = None
+        try:
+            # One pool for the whole job, starting one per directory costs more than it saves
+            if workers > 1:
+                executor = ProcessPoolExecutor(max_workers=workers)
+
+            visited = set(done_dirs)
+            for directory in iter_media_directories(self.media_path):
+                visited.add(directory)
+                if directory in done_dirs:
+                    continue
+                if stop_status() is not None:
+                    raise IndexCancelled()
+
+                result = self.rescan_directories([directory], workers=workers, executor=executor)
+                for key in summary:
+                    summary[key] += result[key]
+                totals["scanned"] += result["added"] + result["updated"] + result["moved"] + result["unchanged"]
+                totals["inserted"] += result["added"]
+                totals["updated"] += result["updated"] + result["moved"]
+                self.checkpoint_index_job(job_id, directory)
+
+            summary["removed"] += self.remove_unindexed_media(visited)
+
+        except IndexCancelled:
+            status = stop_status()
+
+        except Exception as e:
+            print(f"[INDEX ERROR] Job {job_id}: {e}")
+            status = "paused"
+
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            self.progress_callback = report
+            self.set_index_job_status(job_id, status)
+
+        return status, summary
+
+    def checkpoint_index_job(self, job_id, directory):
+        cursor = self.get_cursor()
+        cursor.execute("""
+            INSERT OR IGNORE INTO index_job_dirs (job_id, directory) VALUES (?, ?)
+        """, (job_id, directory))
+        cursor.execute("""
+            UPDATE index_jobs SET updated_at = CURRENT_TIMESTAMP WHERE id = ?
+        """, (job_id,))
+        self.commit(invalidate=False)
+
+    def set_index_job_status(self, job_id, status):
+        cursor = self.get_cursor()
+        cursor.execute("""
+            UPDATE index_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+        """, (status, job_id))
+        if status in ("cancelled", "done"):
+            # Checkpoints only matter while a job can still be resumed
+            cursor.execute("DELETE FROM index_job_dirs WHERE job_id = ?", (job_id,))
+        self.commit(invalidate=False)
+
+    def remove_unindexed_media(self, directories):
+        """
+        Delete rows outside the given indexed directories whose file no longer exists.
+        This catches whole folders removed since the last scan.
+
+        Returns:
+            int: The number of rows removed.
+        """
+        cursor = self.get_cursor()
+        cursor.execute("SELECT id, filepath FROM media")
+        missing_ids = [
+            (media_id,) for media_id, filepath in cursor.fetchall()
+            if os.path.dirname(filepath) not in directories and not os.path.exists(filepath)
+        ]
+        self.delete_media_rows(missing_ids)
+        return len(missing_ids)
+
+    def delete_media_rows(self, media_ids):
+        """Delete rows and their tags, given as (id,) tuples."""
+        if not media_ids:
+            return
+        with self.transaction() as cursor:
+            cursor.executemany("DELETE FROM media_tags WHERE media_id = ?", media_ids)
+            cursor.executemany("DELETE FROM media WHERE id = ?", media_ids)
+        self.tag_index.remove_media(media_id for (media_id,) in media_ids)
+
+    def get_duplicates(self):
+        """
+        Find files with identical content.
+
+        Returns:
+            list[list[int]]: The media ids of each group of duplicates.
+        """
+        with self.read_cursor() as cursor:
+            cursor.execute("""
+                SELECT GROUP_CONCAT(id)
+                FROM media
+                WHERE content_hash IS NOT NULL
+                GROUP BY content_hash
+                HAVING COUNT(*) > 1
+            """)
+            return [[int(i) for i in row[0].split(",")] for row in cursor.fetchall()]
+
+    def extract_all(self, media_files, workers=1, progress=None, executor=None):
+        """
+        Yield metadata rows for media_files in order, using a process pool when
+        workers > 1, or the given executor. Files whose metadata cannot be read
+        are skipped and counted in progress["failed"].
+        """
+        for row in self.extract_rows(media_files, workers, executor):
+            if row is None:
+                if progress is not None:
+                    progress["failed"] += 1
                 continue
+            yield row
 
-            file_type = "video" if file.suffix.lower() in {'.mp4', '.avi', '.mov', '.mkv'} else "image"
-            filesize = file.stat().st_size
+    def extract_rows(self, media_files, workers, executor=None):
+        if workers is None:
+            workers = os.cpu_count() or 1
 
-            # Use st_mtime (modification time) instead of st_ctime (platform dependent)
-            date_added = datetime.fromtimestamp(file.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+        if executor is not None:
+            yield from self.extract_in_pool(executor, media_files, workers)
+        elif workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                yield from self.extract_in_pool(executor, media_files, workers)
+        else:
+            for media_file in media_files:
+                yield try_extract_metadata(media_file)
+
+    def extract_in_pool(self, executor, media_files, workers):
+        # Only a few chunks are in flight at once so a lazy walk stays lazy
+        pending = deque()
+        for chunk in iter_chunks(media_files, 64):
+            pending.append(executor.submit(extract_metadata_batch, chunk))
+            if len(pending) >= workers * 4:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+    @contextmanager
+    def transaction(self):
+        """Run the enclosed statements in one explicit transaction, rolling back on error."""
+        conn = self.get_conn()
+        if self.batch_depth:
+            # Already inside run_batch's transaction, which commits or rolls back for us
+            yield conn.cursor()
+            return
+        if conn.in_transaction:
+            self.commit()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            yield cursor
+        except Exception:
+            conn.rollback()
+            raise
+        self.commit()
 
-            width = height = None
-            format_ = None
-            date_captured = None
-            camera_model = None
+    def commit(self, invalidate=True):
+        """
+        Commit the writer connection and bump the write generation that cached results are checked against.
 
-            if file_type == "image":
-                try:
-                    with Image.open(file) as img:
-                        width, height = img.size
-                        format_ = img.format
-                        exif_data = img._getexif()
-                        if exif_data:
-                            # EXIF tag 36867 = DateTimeOriginal
-                            raw_date = exif_data.get(36867)
-                            if raw_date:
-                                try:
-                                    date_captured = datetime.strptime(raw_date, "%Y:%m:%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
-                                except Exception:
-                                    pass
-                            # EXIF tag 272 = Model (camera)
-                            camera_model = exif_data.get(272)
-                except Exception as e:
-                    print(f"Metadata error for {file.name}: {e}")
+        Parameters:
+            invalidate (bool): False for writes no cached query reads, such as
+                index job checkpoints, so they keep the cache.
+        """
+        if self.batch_depth:
+            return
+        self.get_conn().commit()
+        if invalidate:
+            self.write_generation += 1
+
+    def run_batch(self, calls):
+        """
+        Run several methods in one transaction, so they are committed together
+        with a single sync, or not at all.
 
+        Reads in the batch use the read connections and so do not see the
+        batch's own writes.
+
+        Parameters:
+            calls (list): (method_name, args, kwargs) tuples, run in order.
+
+        Returns:
+            list: The result of each call.
+        """
+        results = []
+        with self.transaction():
+            self.batch_depth += 1
             try:
-                cursor.execute("""
-                    INSERT OR IGNORE INTO media (
-                        filepath, filename, type, width, height,
-                        filesize, format, date_captured, camera_model, date_added
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    str(file), file.name, file_type, width, height,
-                    filesize, format_, date_captured, camera_model, date_added
-                ))
-            except Exception as e:
-                print(f"DB insert error for {file.name}: {e}")
+                for method_name, args, kwargs in calls:
+                    results.append(getattr(self, method_name)(*args, **kwargs))
+            except Exception:
+                # The tag index already holds the rolled back changes
+                self.tag_index.reset()
+                raise
+            finally:
+                self.batch_depth -= 1
+        return results
 
-        self.get_conn().commit()
+    def get_write_generation(self):
+        """
+        Return a value that changes whenever the database is written to.
+        write_generation covers this connection's commits and data_version
+        those of other processes. Safe to call from the read threads, it
+        does not touch the writer connection.
+        """
+        return (self.write_generation, self.data_version)
+
+    def record_data_version(self):
+        """
+        Note the writer connection's data_version, which changes when another
+        process commits. Called on the writer thread before each of its
+        requests, so other processes' commits are seen by the next one.
+        """
+        self.data_version = self.get_conn().execute("PRAGMA data_version").fetchone()[0]
+
+    def cached_query(self, sql, params, fetch):
+        """
+        Run a read query through the filter cache.
+        Cached results are shared between callers and must not be modified.
+
+        Parameters:
+            fetch (callable): Turns the executed cursor into the result to cache.
+        """
+        generation = self.get_write_generation()
+        key = make_key(sql, params)
+        result = self.filter_cache.get(key, generation)
+        if result is None:
+            with self.read_cursor() as cursor:
+                cursor.execute(sql, params)
+                result = fetch(cursor)
+            self.filter_cache.put(key, result, generation)
+        return result
+
+    def get_tag_index(self):
+        """
+        Return the tag index, reloading it when another process has written
+        to the database. Tag writes made here update it as they go, and do
+        not change this connection's data_version.
+        """
+        data_version = self.get_write_generation()[1]
+        if not self.tag_index.loaded or self.tag_index.data_version != data_version:
+            with self.read_cursor() as cursor:
+                self.tag_index.load(cursor, data_version)
+        return self.tag_index
+
+    def get_cache_stats(self):
+        return self.filter_cache.stats()
+
+    def insert_media_rows(self, rows, progress):
+        sql = """
+            INSERT OR IGNORE INTO media (
+                filepath, filename, type, width, height,
+                filesize, format, date_captured, camera_model, date_added,
+                mtime, content_hash, duration
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """
+        progress["inserted"] += self.write_rows(sql, rows, progress)
+
+    def update_media_rows(self, rows, progress):
+        """Refresh the file metadata of existing rows, keeping their filename, tags and stats."""
+        sql = """
+            UPDATE media
+            SET type = ?, width = ?, height = ?, filesize = ?, format = ?,
+                date_captured = ?, camera_model = ?, mtime = ?, content_hash = ?,
+                duration = ?
+            WHERE filepath = ?
+        """
+        params = [row[2:9] + row[10:13] + (row[0],) for row in rows]
+        progress["updated"] += self.write_rows(sql, params, progress)
+
+    def move_media_rows(self, moves, progress):
+        """
+        Point existing rows at the new location of a moved file.
+
+        Parameters:
+            moves (list): (row, media_id, old_path) for each moved file.
+        """
+        sql = """
+            UPDATE media
+            SET filepath = ?,
+                filename = CASE WHEN filename = ? THEN ? ELSE filename END,
+                type = ?, width = ?, height = ?, filesize = ?, format = ?,
+                date_captured = ?, camera_model = ?, mtime = ?, content_hash = ?,
+                duration = ?
+            WHERE id = ?
+        """
+        # A filename the user has edited is kept, otherwise it follows the file
+        params = [
+            (row[0], os.path.basename(old_path), row[1]) + row[2:9] + row[10:13] + (media_id,)
+            for row, media_id, old_path in moves
+        ]
+        progress["updated"] += self.write_rows(sql, params, progress)
+
+    def write_rows(self, sql, params, progress):
+        """
+        executemany a batch in one transaction. If the batch fails it is
+        retried row by row so a single bad file only costs itself.
+
+        Returns:
+            int: The number of rows changed.
+        """
+        if not params:
+            return 0
+        try:
+            with self.transaction() as cursor:
+                cursor.executemany(sql, params)
+                return cursor.rowcount
+        except sqlite3.Error:
+            pass
+
+        changed = 0
+        with self.transaction() as cursor:
+            for row in params:
+                try:
+                    cursor.execute(sql, row)
+                    changed += cursor.rowcount
+                except sqlite3.Error as e:
+                    progress["failed"] += 1
+                    print(f"DB write error for {row}: {e}")
+        return changed
+
+    def start_progress(self, total=None):
+        """
+        Create the stats dict passed to progress_callback during ingest.
+        total is an estimate of the files to scan, or None if unknown.
+        """
+        return {
+            "scanned": 0, "inserted": 0, "updated": 0, "failed": 0,
+            "rate": 0.0, "elapsed": 0.0, "total": total, "started": time.perf_counter()
+        }
+
+    def report_progress(self, progress):
+        progress["elapsed"] = time.perf_counter() - progress["started"]
+        if progress["elapsed"] > 0:
+            progress["rate"] = progress["scanned"] / progress["elapsed"]
+        if self.progress_callback is not None:
+            self.progress_callback(dict(progress))
+        # Only between transactions, so a task run meanwhile never commits half a batch
+        if self.yield_callback is not None and not self.get_conn().in_transaction:
+            self.yield_callback()
 
     def get_first_media(self, limit=10, media_type='image', get_head=True):
-        cursor = self.get_cursor()
-        cursor.execute(f"""
-            SELECT * FROM media
-            WHERE type = ?
-            ORDER BY id {"ASC" if get_head else "DESC"}
-            LIMIT ?
-        """, (media_type, limit))
-        columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        return [dict(zip(columns, row)) for row in rows]
+        with self.read_cursor() as cursor:
+            cursor.execute(f"""
+                SELECT * FROM media
+                WHERE type = ?
+                ORDER BY id {"ASC" if get_head else "DESC"}
+                LIMIT ?
+            """, (media_type, limit))
+            columns = [desc[0] for desc in cursor.description]
+            rows = cursor.fetchall()
+            return [dict(zip(columns, row)) for row in rows]
 
     def get_media_count(self):
-        cursor = self.get_cursor()
-        cursor.execute("SELECT COUNT(*) FROM media")
-        return cursor.fetchone()[0]
+        with self.read_cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM media")
+            return cursor.fetchone()[0]
 
     def get_media_count_by_type(self, media_type="image"):
-        cursor = self.get_cursor()
-        cursor.execute("SELECT COUNT(*) FROM media WHERE type = ?", (media_type,))
-        return cursor.fetchone()[0]
+        with self.read_cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM media WHERE type = ?", (media_type,))
+            return cursor.fetchone()[0]
 
     def toggle_favourite(self, image_id, is_favourite):
         cursor = self.get_cursor()
         cursor.execute("""
             UPDATE media SET is_favourite = ? WHERE id = ?
         """, (1 if is_favourite else 0, image_id))
-        self.get_conn().commit()
+        self.commit()
 
     def get_highest_id(self):
-        cursor = self.get_cursor()
-        cursor.execute("SELECT MAX(id) FROM media")
-        result = cursor.fetchone()
-        return result[0] if result[0] is not None else -1
+        with self.read_cursor() as cursor:
+            cursor.execute("SELECT MAX(id) FROM media")
+            result = cursor.fetchone()
+            return result[0] if result[0] is not None else -1
 
     def get_unique_values(self, column_name, table="media"):
-        cursor = self.get_cursor()
-        query = f"SELECT DISTINCT {column_name} FROM {table}"
-        cursor.execute(query)
-        results = cursor.fetchall()
-        return [row[0] for row in results]
+        with self.read_cursor() as cursor:
+            query = f"SELECT DISTINCT {column_name} FROM {table}"
+            cursor.execute(query)
+            results = cursor.fetchall()
+            return [row[0] for row in results]
 
     def set_image_filename(self, image_id, new_filename):
         cursor = self.get_cursor()
@@ -275,21 +1384,23 @@ class MediaDatabase:
             SET filename = ?
             WHERE id = ?
         """, (new_filename, image_id))
-        self.get_conn().commit()
+        self.commit()
 
     def add_tag(self, tag_name):
         cursor = self.get_cursor()
         cursor.execute("SELECT id FROM tags WHERE name = ?", (tag_name,))
         if cursor.fetchone() is None:
             cursor.execute("INSERT INTO tags (name) VALUES (?)", (tag_name,))
-            self.get_conn().commit()
+            tag_id = cursor.lastrowid
+            self.commit()
+            self.tag_index.add_tag(tag_id, tag_name)
             return True
         return False
 
     def get_all_tags(self):
-        cursor = self.get_cursor()
-        cursor.execute("SELECT name FROM tags ORDER BY name ASC")
-        return [row[0] for row in cursor.fetchall()]
+        with self.read_cursor() as cursor:
+            cursor.execute("SELECT name FROM tags ORDER BY name ASC")
+            return [row[0] for row in cursor.fetchall()]
 
     def set_image_tags(self, image_id, tag_names):
         cursor = self.get_cursor()
@@ -298,6 +1409,7 @@ class MediaDatabase:
         cursor.execute("DELETE FROM media_tags WHERE media_id = ?", (image_id,))
 
         # Add the specified tags
+        tag_ids = []
         for tag_name in tag_names:
             # Try to find tag id
             cursor.execute("SELECT id FROM tags WHERE name = ?", (tag_name,))
@@ -311,12 +1423,16 @@ class MediaDatabase:
                 INSERT INTO media_tags (media_id, tag_id)
                 VALUES (?, ?)
             """, (image_id, tag_id))
+            tag_ids.append(tag_id)
 
-        self.get_conn().commit()
+        self.commit()
+        self.tag_index.remove_media([image_id])
+        self.tag_index.add_media_tags([image_id], tag_ids)
 
     def add_tags_to_image(self, image_id, tag_names):
         cursor = self.get_cursor()
 
+        tag_ids = {}
         for tag_name in tag_names:
             cursor.execute("SELECT id FROM tags WHERE name = ?", (tag_name,))
             tag_row = cursor.fetchone()
@@ -331,8 +1447,12 @@ class MediaDatabase:
                 INSERT OR IGNORE INTO media_tags (media_id, tag_id)
                 VALUES (?, ?)
             """, (image_id, tag_id))
+            tag_ids[tag_name] = tag_id
 
-        self.get_conn().commit()
+        self.commit()
+        for tag_name, tag_id in tag_ids.items():
+            self.tag_index.add_tag(tag_id, tag_name)
+        self.tag_index.add_media_tags([image_id], tag_ids.values())
 
     def add_tag_to_images(self, tag_name, image_ids):
         cursor = self.get_cursor()
@@ -352,149 +1472,164 @@ class MediaDatabase:
                 VALUES (?, ?)
             """, (image_id, tag_id))
 
-        self.get_conn().commit()
+        self.commit()
+        self.tag_index.add_tag(tag_id, tag_name)
+        self.tag_index.add_media_tags(image_ids, [tag_id])
 
     def apply_filters(self, filters, filters_active):
-        cursor = self.get_cursor()
-        where_clauses = []
-        params = []
-
-        # favourite
-        if filters_active.get("is_favourite") and filters.get("is_favourite") is not None:
-            where_clauses.append("m.is_favourite = ?")
-            params.append(1 if filters["is_favourite"] else 0)
-
-        # id
-        if filters_active.get("id") and filters.get("id") is not None:
-            where_clauses.append("m.id = ?")
-            params.append(int(filters["id"]))
-
-        # filename
-        if filters_active.get("name") and filters.get("name") and filters["name"] != "":
-            where_clauses.append("m.filename LIKE ?")
-            params.append(f"%{filters['name']}%")
-
-        # dropdowns
-        text_fields = ["type", "format", "camera_model"]
-        for field in text_fields:
-            if filters_active.get(field) and filters.get(field) and filters[field] != "Any":
-                where_clauses.append(f"m.{field} = ?")
-                params.append(filters[field])
-
-        # ranges
-        range_filters = [
-            ("filesize_min", "filesize_max", "filesize"),
-            ("height_min", "height_max", "height"),
-            ("width_min", "width_max", "width"),
-            ("times_viewed_min", "times_viewed_max", "times_viewed"),
-            ("time_viewed_min", "time_viewed_max", "time_viewed"),
-            ("date_captured_min", "date_captured_max", "date_captured"),
-            ("date_added_min", "date_added_max", "date_added"),
-        ]
-        for min_key, max_key, col in range_filters:
-            col_base = col.split("_")[0]
-            if filters_active.get(col_base) or filters_active.get(col):
-                min_val = filters.get(min_key)
-                max_val = filters.get(max_key)
-
-                if min_val is not None:
-                    if "date" in col:
-                        where_clauses.append(f"datetime(m.{col}) >= datetime(?)")
-                    else:
-                        where_clauses.append(f"m.{col} >= ?")
-                    params.append(min_val)
-
-                if max_val is not None:
-                    if "date" in col:
-                        where_clauses.append(f"datetime(m.{col}) <= datetime(?)")
-                    else:
-                        where_clauses.append(f"m.{col} <= ?")
-                    params.append(max_val)
-
-        # tags
-        tag_names = [t for t in (filters.get("tags") or []) if t]
-        if tag_names:
-            tag_mode = filters.get("tag_mode", "any")
-            placeholders = ",".join("?" for _ in tag_names)
-
-            match tag_mode:
-                case "any":
-                    # images with at least one of the tags
-                    where_clauses.append(f"""
-                        m.id IN (
-                            SELECT media_id
-                            FROM media_tags
-                            JOIN tags ON media_tags.tag_id = tags.id
-                            WHERE tags.name IN ({placeholders})
-                        )
-                    """)
-                    params.extend(tag_names)
-
-                case "all":
-                    # images with at least all of the tags
-                    where_clauses.append(f"""
-                        m.id IN (
-                            SELECT media_id
-                            FROM media_tags
-                            JOIN tags ON media_tags.tag_id = tags.id
-                            WHERE tags.name IN ({placeholders})
-                            GROUP BY media_id
-                            HAVING COUNT(DISTINCT tags.name) = {len(tag_names)}
-                        )
-                    """)
-                    params.extend(tag_names)
-
-                case "exact":
-                    # images with only these tags
-                    where_clauses.append(f"""
-                        m.id IN (
-                            SELECT media_id
-                            FROM media_tags
-                            JOIN tags ON media_tags.tag_id = tags.id
-                            GROUP BY media_id
-                            HAVING 
-                                COUNT(DISTINCT tags.name) = {len(tag_names)}
-                                AND SUM(CASE WHEN tags.name IN ({placeholders}) THEN 1 ELSE 0 END) = {len(tag_names)}
-                        )
-                    """)
-                    params.extend(tag_names)
-
-                case "none":
-                    # images with none of these tags
-                    where_clauses.append(f"""
-                        m.id NOT IN (
-                            SELECT media_id
-                            FROM media_tags
-                            JOIN tags ON media_tags.tag_id = tags.id
-                            WHERE tags.name IN ({placeholders})
-                        )
-                    """)
-                    params.extend(tag_names)
-
-                case _:
-                    print(f"Unknown tag_mode: {tag_mode}")
-
-        # main query
-        sql = """
-            SELECT m.*, GROUP_CONCAT(t.name, ',') as tags
-            FROM media m
-            LEFT JOIN media_tags mt ON m.id = mt.media_id
-            LEFT JOIN tags t ON mt.tag_id = t.id
-        """
-        if where_clauses:
-            sql += " WHERE " + " AND ".join(where_clauses)
-        sql += " GROUP BY m.id"
-        sql += f" ORDER BY {filters['sort_value']} "
-        sql += "DESC" if filters['sort_dir'] else "ASC"
-
-        cursor.execute(sql, params)
-        columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
+        """Return every media row matching the filters, in the chosen sort order."""
+        plan, params = self.compile_filters(filters, filters_active)
+        return self.cached_query(plan.select_sql, params, self.fetch_media_rows)
+
+    def iter_filtered(self, filters, filters_active, chunk_size=STREAM_CHUNK_SIZE, limit=None):
+        """
+        Yield the media rows matching the filters in lists of up to chunk_size,
+        so the first rows can be shown before the rest are read.
+
+        Parameters:
+            limit (int | None): The most rows to yield in total.
+        """
+        plan, params = self.compile_filters(filters, filters_active)
+        sql = plan.select_sql
+        if limit is not None:
+            sql = plan.limit_sql
+            params.append(limit)
+
+        generation = self.get_write_generation()
+        key = make_key(sql, params)
+        cached = self.filter_cache.get(key, generation)
+        if cached is not None:
+            for start in range(0, len(cached), chunk_size):
+                yield cached[start:start + chunk_size]
+            return
 
         results = []
-        for row in rows:
-            row_dict = dict(zip(columns, row))
-            row_dict["tags"] = row_dict["tags"].split(",") if row_dict["tags"] else []
-            results.append(row_dict)
+        with self.read_cursor() as cursor:
+            cursor.execute(sql, params)
+            columns = [desc[0] for desc in cursor.description]
+            while rows := cursor.fetchmany(chunk_size):
+                chunk = [dict(zip(columns, row)) for row in rows]
+                self.attach_tags(cursor.connection, chunk)
+                results.extend(chunk)
+                yield chunk
+        self.filter_cache.put(key, results, generation)
+
+    def get_filtered_page(self, filters, filters_active, page_size=PAGE_SIZE, cursor=None):
+        """
+        Return one page of the media rows matching the filters.
 
-        return results
+        Pages are found by keyset, seeking past the last row of the previous
+        page in the sort index, so later pages cost the same as the first.
+
+        Parameters:
+            page_size (int): The most rows to return.
+            cursor: The "cursor" of the previous page, None for the first page.
+
+        Returns:
+            dict: "rows", a list of row dicts, and "cursor", to pass back for
+                the next page, or None when this is the last page.
+        """
+        plan, params = self.compile_filters(filters, filters_active)
+
+        last_value = last_id = None
+        if cursor is not None:
+            cursor_sort, cursor_desc, last_value, last_id = cursor
+            if (cursor_sort, cursor_desc) != (plan.sort_col, plan.descending):
+                raise ValueError("Page cursor was made for a different sort order")
+
+        sql, keyset_params = plan.page(last_value, last_id)
+        params.extend(keyset_params)
+        params.append(page_size + 1)  # one extra row tells us whether there is a next page
+
+        rows = self.cached_query(sql, params, self.fetch_media_rows)
+
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_cursor = (plan.sort_col, plan.descending, last[plan.sort_col], last["id"])
+
+        return {"rows": rows, "cursor": next_cursor}
+
+    def count_filtered(self, filters, filters_active):
+        """Return how many media rows match the filters, without fetching them."""
+        plan, params = self.compile_filters(filters, filters_active)
+
+        # A tag filter on its own is counted from the tag index, SQL would
+        # have to visit every match
+        if plan.names and TAG_CONDITIONS.issuperset(plan.names):
+            tag_names, tag_mode = self.filter_compiler.tag_filter(filters)
+            matched = self.get_tag_index().count(tag_names, tag_mode)
+            if tag_mode == "none":
+                total = self.cached_query("SELECT COUNT(*) FROM media", [], lambda cursor: cursor.fetchone()[0])
+                return total - matched
+            return matched
+
+        return self.cached_query(plan.count_sql, params, lambda cursor: cursor.fetchone()[0])
+
+    def get_facets(self, filters, filters_active):
+        """
+        Count the media matching the filters by each sidebar facet.
+
+        Returns:
+            dict: "total", the number of matches. "type", "format",
+                "camera_model", "is_favourite" and "tags", each a dict of
+                value -> count. "ranges", column -> (min, max) over the matches.
+        """
+        plan, params = self.compile_filters(filters, filters_active)
+        groups = self.cached_query(plan.facet_sql, params, lambda cursor: cursor.fetchall())
+
+        facets = {col: {} for col in FACET_COLUMNS}
+        facets["total"] = 0
+        ranges = {}
+        width = len(FACET_COLUMNS)
+        for group in groups:
+            count = group[width]
+            facets["total"] += count
+            for col, value in zip(FACET_COLUMNS, group):
+                facets[col][value] = facets[col].get(value, 0) + count
+
+            for i, col in enumerate(FACET_RANGE_COLUMNS):
+                low, high = group[width + 1 + i * 2], group[width + 2 + i * 2]
+                if low is None:
+                    continue
+                if col in ranges:
+                    low = min(low, ranges[col][0])
+                    high = max(high, ranges[col][1])
+                ranges[col] = (low, high)
+        facets["ranges"] = ranges
+
+        if plan.conditions:
+            rows = self.cached_query(plan.tag_facet_sql, params, lambda cursor: cursor.fetchall())
+            facets["tags"] = dict(rows)
+        else:
+            # Unfiltered tag counts are just the size of each tag's set
+            facets["tags"] = self.get_tag_index().counts()
+
+        return facets
+
+    def compile_filters(self, filters, filters_active):
+        return self.filter_compiler.compile(filters, filters_active, self.get_tag_index, self.has_fts)
+
+    def match_tags(self, tag_names, tag_mode):
+        return self.get_tag_index().match(tag_names, tag_mode)
+
+    def fetch_media_rows(self, cursor):
+        columns = [desc[0] for desc in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        self.attach_tags(cursor.connection, rows)
+        return rows
+
+    def attach_tags(self, conn, rows):
+        """Set "tags" on each row dict, with one query for the whole batch."""
+        tags_by_id = {}
+        for row in rows:
+            row["tags"] = tags_by_id[row["id"]] = []
+        if not tags_by_id:
+            return
+
+        # A cursor of its own, as the caller's may still be reading results
+        cursor = conn.cursor()
+        cursor.execute(MEDIA_TAGS_SELECT, (json.dumps(list(tags_by_id)),))
+        for media_id, name in cursor.fetchall():
+            tags_by_id[media_id].append(name)
@@ -0,0 +1,308 @@
+from collections import OrderedDict
+from datetime import datetime
+import calendar
+import json
+import threading
+
+PLAN_CACHE_SIZE = 64  # compiled plans kept, one per combination of active filters and sort
+FTS_MIN_QUERY = 3  # trigrams need at least this many characters to use the index
+TAG_ID_LIST_MAX = 2000  # tag matches up to this size are bound as a list of media ids
+
+# Gallery query. Tags are not joined in, they are fetched afterwards for
+# just the rows returned, with MEDIA_TAGS_SELECT
+MEDIA_SELECT = "SELECT m.* FROM media m"
+
+# Tag names of a batch of media, whose ids are bound as a JSON array
+MEDIA_TAGS_SELECT = """
+    SELECT mt.media_id, t.name
+    FROM media_tags mt
+    JOIN tags t ON t.id = mt.tag_id
+    WHERE mt.media_id IN (SELECT value FROM json_each(?))
+"""
+
+# Values allowed for filters["sort_value"] and the column each sorts by.
+# Dates sort by their epoch column, which is indexed
+SORT_COLUMNS = {
+    "id": "id",
+    "filename": "filename",
+    "type": "type",
+    "format": "format",
+    "camera_model": "camera_model",
+    "is_favourite": "is_favourite",
+    "filesize": "filesize",
+    "height": "height",
+    "width": "width",
+    "times_viewed": "times_viewed",
+    "time_viewed": "time_viewed",
+    "duration": "duration",
+    "date_captured": "date_captured_ts",
+    "date_added": "date_added_ts",
+}
+
+# Text date columns and the epoch columns that filters and sorts use instead
+DATE_COLUMNS = {
+    "date_captured": "date_captured_ts",
+    "date_added": "date_added_ts",
+}
+
+TEXT_FILTERS = ["type", "format", "camera_model"]
+
+RANGE_FILTERS = [
+    ("filesize_min", "filesize_max", "filesize"),
+    ("height_min", "height_max", "height"),
+    ("width_min", "width_max", "width"),
+    ("times_viewed_min", "times_viewed_max", "times_viewed"),
+    ("time_viewed_min", "time_viewed_max", "time_viewed"),
+    ("date_captured_min", "date_captured_max", "date_captured"),
+    ("date_added_min", "date_added_max", "date_added"),
+    ("duration_min", "duration_max", "duration"),
+]
+
+# Columns the facets count matches for, and the range columns they report min and max of
+FACET_COLUMNS = ["type", "format", "camera_model", "is_favourite"]
+FACET_RANGE_COLUMNS = [col for _, _, col in RANGE_FILTERS]
+
+# SQL for the conditions that are not a plain column comparison. Every value
+# is bound as a parameter, so the same active filters always give the same statement
+CONDITIONS = {
+    "is_favourite": "m.is_favourite = ?",
+    "id": "m.id = ?",
+    # LIKE on the trigram table is answered from the index, with the same case rules
+    "filename_fts": "m.id IN (SELECT rowid FROM media_fts WHERE filename LIKE ?)",
+    "filename_like": "m.filename LIKE ?",
+    # The tag index resolves tag filters to media ids, which SQL reads as a JSON array
+    "tags_in": "m.id IN (SELECT value FROM json_each(?))",
+    "tags_not_in": "m.id NOT IN (SELECT value FROM json_each(?))",
+    # Larger matches would make that array costly to build, hash and expand on
+    # every query, so each row is checked against media_tags by tag id instead.
+    # A page stops after a few rows, so only a few are checked
+    "tags_any": "EXISTS (SELECT 1 FROM media_tags mt2 WHERE mt2.media_id = m.id"
+                " AND mt2.tag_id IN (SELECT value FROM json_each(?)))",
+    "tags_none": "NOT EXISTS (SELECT 1 FROM media_tags mt2 WHERE mt2.media_id = m.id"
+                 " AND mt2.tag_id IN (SELECT value FROM json_each(?)))",
+    "tags_all": "(SELECT COUNT(*) FROM media_tags mt2 WHERE mt2.media_id = m.id"
+                " AND mt2.tag_id IN (SELECT value FROM json_each(?))) = ?",
+    "tags_exact": "(SELECT COUNT(*) FROM media_tags mt2 WHERE mt2.media_id = m.id) = ?",
+}
+TAG_CONDITIONS = {"tags_in", "tags_not_in", "tags_any", "tags_none", "tags_all", "tags_exact"}
+
+def to_epoch(value):
+    """Convert a "YYYY-MM-DD HH:MM:SS" string to epoch seconds, treating it as UTC like SQLite's strftime('%s')."""
+    if value is None:
+        return None
+    return calendar.timegm(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timetuple())
+
+def condition_sql(name):
+    """SQL for a condition name from FilterCompiler.bind, "<column>_min", "<column>_max" or a column."""
+    if name in CONDITIONS:
+        return CONDITIONS[name]
+    if name.endswith("_min"):
+        return f"m.{name[:-4]} >= ?"
+    if name.endswith("_max"):
+        return f"m.{name[:-4]} <= ?"
+    return f"m.{name} = ?"
+
+class FilterPlan:
+    """The statements for one combination of active filters and sort order, built once and reused."""
+
+    def __init__(self, conditions, sort_col, descending):
+        self.sort_col = sort_col
+        self.descending = descending
+        self.names = conditions
+        self.conditions = [condition_sql(name) for name in conditions]
+
+        direction = "DESC" if descending else "ASC"
+        # id breaks ties so the order, and so the keyset, is total
+        if sort_col == "id":
+            self.order_by = f" ORDER BY m.id {direction}"
+        else:
+            self.order_by = f" ORDER BY m.{sort_col} {direction}, m.id {direction}"
+
+        self.select_sql = MEDIA_SELECT + self.where() + self.order_by
+        self.limit_sql = self.select_sql + " LIMIT ?"
+        self.count_sql = "SELECT COUNT(*) FROM media m" + self.where()
+        self.page_sqls = {}
+
+        # Facets group the matches by every facet column at once, so one scan
+        # gives the counts for each column and the ranges, merged in Python
+        group_cols = ", ".join(f"m.{col}" for col in FACET_COLUMNS)
+        range_aggregates = ", ".join(f"MIN(m.{col}), MAX(m.{col})" for col in FACET_RANGE_COLUMNS)
+        self.facet_sql = (f"SELECT {group_cols}, COUNT(*), {range_aggregates} FROM media m"
+                          + self.where() + f" GROUP BY {group_cols}")
+        self.tag_facet_sql = ("SELECT t.name, COUNT(*) FROM media_tags mt"
+                              " JOIN tags t ON t.id = mt.tag_id JOIN media m ON m.id = mt.media_id"
+                              + self.where() + " GROUP BY t.name")
+
+    def where(self, extra=None):
+        conditions = self.conditions + ([extra] if extra else [])
+        return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    def page(self, last_value=None, last_id=None):
+        """
+        Return the page statement and the keyset parameters for the rows after
+        (last_value, last_id), or for the first page when last_id is None.
+        The statement takes the filter parameters, then these, then the limit.
+        """
+        if last_id is None:
+            kind, params = "first", []
+        elif self.sort_col == "id":
+            kind, params = "after", [last_id]
+        elif last_value is None:
+            kind, params = "after_null", [last_id]
+        else:
+            kind, params = "after", [last_value, last_id]
+
+        if kind not in self.page_sqls:
+            extra = self.keyset_condition(kind)
+            self.page_sqls[kind] = MEDIA_SELECT + self.where(extra) + self.order_by + " LIMIT ?"
+        return self.page_sqls[kind], params
+
+    def keyset_condition(self, kind):
+        """
+        SQLite sorts NULL first ascending and last descending, so NULL sort
+        values need their own cases.
+        """
+        col = self.sort_col
+        if kind == "first":
+            return None
+        if col == "id":
+            return "m.id < ?" if self.descending else "m.id > ?"
+
+        if self.descending:
+            if kind == "after_null":
+                return f"(m.{col} IS NULL AND m.id < ?)"
+            return f"((m.{col}, m.id) < (?, ?) OR m.{col} IS NULL)"
+
+        if kind == "after_null":
+            return f"((m.{col} IS NULL AND m.id > ?) OR m.{col} IS NOT NULL)"
+        return f"(m.{col}, m.id) > (?, ?)"
+
+class FilterCompiler:
+    """
+    Turns the gallery filters into a FilterPlan and its parameters.
+
+    Plans are cached by the conditions they use and the sort, so repeated
+    queries reuse the same SQL text, and with it the prepared statement
+    sqlite3 keeps for that text on each connection.
+    """
+
+    def __init__(self, max_plans=PLAN_CACHE_SIZE):
+        self.max_plans = max_plans
+        self.plans = OrderedDict()
+        self.lock = threading.Lock()
+
+    def compile(self, filters, filters_active, tag_index, has_fts):
+        """
+        Parameters:
+            tag_index (callable): Returns the up to date TagIndex.
+            has_fts (callable): Whether the filename search index exists.
+
+        Returns:
+            tuple: (FilterPlan, params)
+        """
+        sort_value = filters.get("sort_value", "id")
+        if sort_value not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort column: {sort_value}")
+
+        conditions, params = self.bind(filters, filters_active, tag_index, has_fts)
+        shape = (tuple(conditions), SORT_COLUMNS[sort_value], bool(filters.get("sort_dir")))
+
+        with self.lock:
+            plan = self.plans.get(shape)
+            if plan is None:
+                plan = FilterPlan(*shape)
+                self.plans[shape] = plan
+                if len(self.plans) > self.max_plans:
+                    self.plans.popitem(last=False)
+            else:
+                self.plans.move_to_end(shape)
+
+        return plan, params
+
+    def bind(self, filters, filters_active, tag_index, has_fts):
+        """Return the names of the conditions the filters use, and their parameters."""
+        conditions = []
+        params = []
+
+        # favourite
+        if filters_active.get("is_favourite") and filters.get("is_favourite") is not None:
+            conditions.append("is_favourite")
+            params.append(1 if filters["is_favourite"] else 0)
+
+        # id
+        if filters_active.get("id") and filters.get("id") is not None:
+            conditions.append("id")
+            params.append(int(filters["id"]))
+
+        # filename
+        if filters_active.get("filename") and filters.get("filename"):
+            query = filters["filename"]
+            if len(query) >= FTS_MIN_QUERY and has_fts():
+                conditions.append("filename_fts")
+            else:
+                conditions.append("filename_like")
+            params.append(f"%{query}%")
+
+        # dropdowns
+        for field in TEXT_FILTERS:
+            if filters_active.get(field) and filters.get(field) and filters[field] != "Any":
+                conditions.append(field)
+                params.append(filters[field])
+
+        # ranges
+        for min_key, max_key, col in RANGE_FILTERS:
+            col_base = col.split("_")[0]
+            if filters_active.get(col_base) or filters_active.get(col):
+                min_val = filters.get(min_key)
+                max_val = filters.get(max_key)
+
+                # Dates compare as epoch integers so the column index can be used
+                if col in DATE_COLUMNS:
+                    col = DATE_COLUMNS[col]
+                    min_val = to_epoch(min_val)
+                    max_val = to_epoch(max_val)
+
+                if min_val is not None:
+                    conditions.append(f"{col}_min")
+                    params.append(min_val)
+
+                if max_val is not None:
+                    conditions.append(f"{col}_max")
+                    params.append(max_val)
+
+        # tags
+        tag_names, tag_mode = self.tag_filter(filters)
+        if tag_names:
+            if tag_mode not in ("any", "all", "exact", "none"):
+                print(f"Unknown tag_mode: {tag_mode}")
+                return conditions, params
+
+            index = tag_index()
+            if index.size_bound(tag_names, tag_mode) <= TAG_ID_LIST_MAX:
+                conditions.append("tags_not_in" if tag_mode == "none" else "tags_in")
+                params.append(json.dumps(sorted(index.match(tag_names, tag_mode))))
+            else:
+                # Only tags that exist, "all" and "exact" match nothing otherwise
+                tag_ids = json.dumps(index.ids(tag_names))
+                match tag_mode:
+                    case "any":
+                        conditions.append("tags_any")
+                        params.append(tag_ids)
+
+                    case "none":
+                        conditions.append("tags_none")
+                        params.append(tag_ids)
+
+                    case "all" | "exact":
+                        conditions.append("tags_all")
+                        params.extend([tag_ids, len(tag_names)])
+                        if tag_mode == "exact":
+                            conditions.append("tags_exact")
+                            params.append(len(tag_names))
+
+        return conditions, params
+
+    def tag_filter(self, filters):
+        """Return the filter's tag names, sorted so equal filters share a cache entry, and its mode."""
+        tag_names = sorted(t for t in (filters.get("tags") or []) if t)
+        return tag_names, filters.get("tag_mode", "any")
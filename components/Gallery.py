@@ -313,6 +313,8 @@ class GalleryCell(StyledWidget):
         table_data.append(["Camera Model", str(self.data.get('camera_model') or 'N/A')])
         table_data.append(["Times Viewed", str(self.data.get('times_viewed') or 0)])
         table_data.append(["Duration Viewed", str(self.data.get('time_viewed') or 0)])
+        duration = self.data.get('duration')
+        table_data.append(["Length", f"{duration:.1f} s" if duration is not None else 'N/A'])
         table_data.append(["Date Captured", str(self.data.get('date_captured') or 'Unknown')])
         table_data.append(["Date Added", str(self.data.get('date_added') or 'Unknown')])
         self.details = GalleryCellTable(table_data, width=self.width, parent=self)
@@ -405,6 +407,8 @@ class Gallery(StyledWidget):
             "times_viewed_max": 0,
             "time_viewed_min": 0,
             "time_viewed_max": 0,
+            "duration_min": 0,
+            "duration_max": 0,
             "date_captured_min": None,
             "date_captured_max": None,
             "date_added_min": None,
@@ -427,6 +431,7 @@ class Gallery(StyledWidget):
             "width": False,
             "times_viewed": False,
             "time_viewed": False,
+            "duration": False,
             "date_captured": False,
             "date_added": False
         }
@@ -480,12 +485,19 @@ class Gallery(StyledWidget):
     def populate_gallery(self):
         self.clear_grid_layout(self.grid_layout)
 
-        self.parent.call_worker(
-            "apply_filters",
+        # Streamed a row of cells at a time so the first ones paint straight away
+        future = self.parent.call_worker(
+            "iter_filtered",
             self.filters,
             self.filters_active,
+            chunk_size=self.columns,
+            limit=self.cells_max,
+            stream=True,
+            supersede="gallery",
             context="populate_gallery"
         )
+        future.chunk.connect(self.parent.handle_gallery_chunk)
+        future.done.connect(self.parent.handle_gallery_finished)
 
     def add_cell(self, widget):
         row = self.cell_count // self.columns
@@ -0,0 +1,59 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from components.Database import LANE_BACKGROUND
+from components.Requests import DatabaseRequest
+
+class IndexWorker(QObject):
+    """
+    Starts, pauses and cancels the resumable index job, MediaDatabase.run_index_job.
+
+    The job runs on the DatabaseWorker's writer thread in the background
+    lane, so it shares the single writer connection and interactive work
+    runs between its batches. Its progress arrives through DatabaseWorker.progress.
+    """
+    finished = pyqtSignal(str, object)  # final status, summary
+
+    def __init__(self, db_worker, workers=None):
+        super().__init__()
+        self.db_worker = db_worker
+        self.workers = workers  # extraction processes, None for one per CPU
+        self.stop_status = None  # read by the job between batches to stop it
+        self.running = False
+
+    def run(self):
+        if self.running:
+            return
+        self.running = True
+        self.stop_status = None
+
+        request = DatabaseRequest(
+            "run_index_job", kwargs={"workers": self.workers, "should_stop": lambda: self.stop_status},
+            lane=LANE_BACKGROUND
+        )
+        future = self.db_worker.submit(request)
+        future.done.connect(self.on_done)
+        future.failed.connect(self.on_failed)
+        future.cancelled.connect(self.on_cancelled)
+
+    def on_done(self, result):
+        self.running = False
+        status, summary = result
+        self.finished.emit(status, summary)
+
+    def on_failed(self, message):
+        self.running = False
+        print(f"[INDEX ERROR] {message}")
+
+    def on_cancelled(self):
+        # Dropped before it ran, on shutdown. The job keeps its checkpoints
+        self.running = False
+
+    def pause(self):
+        """Stop after the current batch, keeping checkpoints so the job can resume."""
+        if self.running:
+            self.stop_status = "paused"
+
+    def cancel(self):
+        """Stop after the current batch and discard the job."""
+        if self.running:
+            self.stop_status = "cancelled"
@@ -22,6 +22,7 @@ class Dropdown(QComboBox):
         self.setCursor(Qt.PointingHandCursor)
         self.filter_key = filter_key
         self.values = values
+        self.labels = list(items) if items else []
 
         if items:
             self.addItems(items)
@@ -38,6 +39,27 @@ class Dropdown(QComboBox):
 
     def reset(self):
         self.setCurrentIndex(0)
+
+    def set_counts(self, counts):
+        """
+        Show the number of matches beside each item, adding any value in
+        counts that is not listed yet.
+
+        Parameters:
+            counts (dict): value -> number of matches.
+        """
+        if self.values is None:
+            # Item text is about to change, so keep the values separately
+            self.values = list(self.labels)
+
+        for value in counts:
+            if value not in self.values:
+                self.values.append(value)
+                self.labels.append(str(value))
+                self.addItem("")
+
+        for i, (label, value) in enumerate(zip(self.labels, self.values)):
+            self.setItemText(i, f"{label} ({counts.get(value, 0)})")
         
 class TextInput(QLineEdit):
     on_filter_changed = pyqtSignal(str, object)
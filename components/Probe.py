@@ -0,0 +1,391 @@
+import struct
+from datetime import datetime, timezone
+
+# JPEG start-of-frame markers that carry the image dimensions
+JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF
+}
+
+EXIF_MODEL = 272
+EXIF_IFD_POINTER = 34665
+EXIF_DATE_TIME_ORIGINAL = 36867
+
+# Seconds between the container epochs and the Unix epoch
+MP4_EPOCH_OFFSET = 2082844800  # 1904-01-01
+MATROSKA_EPOCH_OFFSET = 978307200  # 2001-01-01
+
+# Matroska element ids
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_TRACKS = 0x1654AE6B
+MKV_CLUSTER = 0x1F43B675
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_DATE_UTC = 0x4461
+MKV_TRACK_ENTRY = 0xAE
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+
+def probe_image(filepath):
+    """
+    Read width, height, format and the two EXIF tags we store straight from the file header.
+
+    Only the header segments are read, skipping over pixel data with seeks, so
+    this avoids Pillow's plugin detection and full EXIF decoding.
+
+    Returns:
+        tuple | None: (width, height, format, date_captured, camera_model), or
+            None when the file is not something this probe can answer for and
+            the caller should fall back to Pillow.
+    """
+    try:
+        with open(filepath, "rb") as f:
+            head = f.read(32)
+            if head.startswith(b"\xff\xd8"):
+                return _probe_jpeg(f)
+            if head.startswith(b"\x89PNG\r\n\x1a\n"):
+                return _probe_png(f, head)
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                width, height = struct.unpack("<HH", head[6:10])
+                return width, height, "GIF", None, None
+            if head.startswith(b"BM"):
+                return _probe_bmp(head)
+    except (OSError, struct.error, ValueError, IndexError):
+        pass
+    return None
+
+def _probe_jpeg(f):
+    f.seek(2)
+    exif = None
+
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+
+        # Fill bytes may pad between segments
+        while marker[1] == 0xFF:
+            marker = marker[1:] + f.read(1)
+            if len(marker) < 2:
+                return None
+
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        if code in (0xD9, 0xDA):
+            # Reached image data (or the end) without a frame header
+            return None
+
+        length = struct.unpack(">H", f.read(2))[0]
+        if length < 2:
+            return None
+
+        if code in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">xHH", f.read(5))
+            date_captured, camera_model = _parse_exif(exif) if exif else (None, None)
+            return width, height, "JPEG", date_captured, camera_model
+
+        if code == 0xE1 and exif is None:
+            segment = f.read(length - 2)
+            if segment.startswith(b"Exif\x00\x00"):
+                exif = segment[6:]
+            continue
+
+        if code == 0xE2:
+            # Multi-picture files are reported as MPO by Pillow, let it handle those
+            segment = f.read(length - 2)
+            if segment.startswith(b"MPF\x00"):
+                return None
+            continue
+
+        f.seek(length - 2, 1)
+
+def _parse_exif(data):
+    """Return (date_captured, camera_model) from a raw TIFF-structured EXIF block."""
+    if data[:4] == b"II*\x00":
+        endian = "<"
+    elif data[:4] == b"MM\x00*":
+        endian = ">"
+    else:
+        return None, None
+
+    ifd0 = _read_ifd(data, struct.unpack(endian + "I", data[4:8])[0], endian)
+    camera_model = ifd0.get(EXIF_MODEL)
+
+    date_captured = None
+    exif_offset = ifd0.get(EXIF_IFD_POINTER)
+    if isinstance(exif_offset, int):
+        raw_date = _read_ifd(data, exif_offset, endian).get(EXIF_DATE_TIME_ORIGINAL)
+        if raw_date:
+            try:
+                date_captured = datetime.strptime(raw_date, "%Y:%m:%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+            except Exception:
+                pass
+
+    return date_captured, camera_model
+
+def _read_ifd(data, offset, endian):
+    """Read the ASCII and LONG entries of one IFD, which is all we need."""
+    values = {}
+    if offset + 2 > len(data):
+        return values
+
+    count = struct.unpack(endian + "H", data[offset:offset + 2])[0]
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        if entry + 12 > len(data):
+            break
+        tag, type_, n = struct.unpack(endian + "HHI", data[entry:entry + 8])
+
+        if type_ == 2:  # ASCII
+            if n <= 4:
+                raw = data[entry + 8:entry + 8 + n]
+            else:
+                start = struct.unpack(endian + "I", data[entry + 8:entry + 12])[0]
+                raw = data[start:start + n]
+            # Match Pillow, which drops a single trailing NUL
+            if raw.endswith(b"\x00"):
+                raw = raw[:-1]
+            values[tag] = raw.decode("latin-1", "replace")
+        elif type_ == 4 and n == 1:  # LONG
+            values[tag] = struct.unpack(endian + "I", data[entry + 8:entry + 12])[0]
+
+    return values
+
+def _probe_png(f, head):
+    if head[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", head[16:24])
+
+    # Pillow reports EXIF held in eXIf or raw profile text chunks, anywhere in
+    # the file, so walk the chunk headers and defer to it if one exists
+    f.seek(8)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type == b"IEND":
+            return width, height, "PNG", None, None
+        if chunk_type == b"eXIf":
+            return None
+        if chunk_type in (b"tEXt", b"zTXt", b"iTXt"):
+            keyword = f.read(min(length, 80))
+            if keyword.startswith(b"Raw profile type exif"):
+                return None
+            f.seek(length - len(keyword) + 4, 1)
+        else:
+            f.seek(length + 4, 1)
+
+def _probe_bmp(head):
+    header_size = struct.unpack("<I", head[14:18])[0]
+    if header_size == 12:
+        width, height = struct.unpack("<HH", head[18:22])
+    elif header_size >= 40:
+        width, height = struct.unpack("<ii", head[18:26])
+    else:
+        return None
+    return width, abs(height), "BMP", None, None
+
+def probe_video(filepath):
+    """
+    Read dimensions, duration and creation time from a video container without decoding frames.
+
+    Handles ISO-BMFF (MP4 and MOV), Matroska and AVI by reading only the
+    header boxes, elements or chunks that carry this information.
+
+    Returns:
+        tuple | None: (width, height, format, date_captured, duration), with
+            duration in seconds, or None if the container is not recognised.
+    """
+    try:
+        with open(filepath, "rb") as f:
+            head = f.read(12)
+            f.seek(0)
+            if head[4:8] in (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip"):
+                return _probe_bmff(f)
+            if head.startswith(b"\x1a\x45\xdf\xa3"):
+                return _probe_matroska(f)
+            if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+                return _probe_avi(f)
+    except (OSError, struct.error, ValueError, OverflowError, IndexError):
+        pass
+    return None
+
+def _format_timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def _iter_boxes(f, start, end):
+    """Yield (type, payload_start, box_end) for the ISO-BMFF boxes between start and end."""
+    offset = start
+    while end is None or offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = offset + 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            payload += 8
+        elif size == 0:
+            # Box runs to the end of the file
+            f.seek(0, 2)
+            size = f.tell() - offset
+        if size < payload - offset:
+            return
+        yield box_type, payload, offset + size
+        offset += size
+
+def _probe_bmff(f):
+    format_ = "MP4"
+    moov = None
+    for box_type, payload, box_end in _iter_boxes(f, 0, None):
+        if box_type == b"ftyp":
+            f.seek(payload)
+            if f.read(4) == b"qt  ":
+                format_ = "MOV"
+        elif box_type == b"moov":
+            moov = (payload, box_end)
+            break
+    if moov is None:
+        return None
+
+    width = height = None
+    date_captured = None
+    duration = None
+
+    for box_type, payload, box_end in _iter_boxes(f, *moov):
+        if box_type == b"mvhd":
+            f.seek(payload)
+            # Unpacked rather than indexed, so a cut off box raises struct.error
+            version, = struct.unpack(">B3x", f.read(4))
+            if version == 1:
+                created, _, timescale, length = struct.unpack(">QQIQ", f.read(28))
+            else:
+                created, _, timescale, length = struct.unpack(">IIII", f.read(16))
+            if created:
+                date_captured = _format_timestamp(created - MP4_EPOCH_OFFSET)
+            if timescale:
+                duration = length / timescale
+        elif box_type == b"trak" and width is None:
+            for child_type, child_payload, _ in _iter_boxes(f, payload, box_end):
+                if child_type != b"tkhd":
+                    continue
+                f.seek(child_payload)
+                version, = struct.unpack(">B3x", f.read(4))
+                # Skip the times, track id and duration to reach the size fields
+                f.seek(child_payload + (88 if version == 1 else 76))
+                track_width, track_height = struct.unpack(">II", f.read(8))
+                # Sound tracks have no size, keep looking for the video track
+                if track_width and track_height:
+                    width, height = track_width >> 16, track_height >> 16
+
+    return width, height, format_, date_captured, duration
+
+def _read_vint(f, keep_marker):
+    first = f.read(1)
+    if not first:
+        raise ValueError("Unexpected end of file")
+    byte = first[0]
+    length = 1
+    while length <= 8 and not byte & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable length integer")
+
+    value = byte if keep_marker else byte & (0xFF >> length)
+    rest = f.read(length - 1)
+    all_ones = value == (0xFF >> length) and rest == b"\xff" * (length - 1)
+    for b in rest:
+        value = (value << 8) | b
+    # An all ones size means the element size is unknown
+    return value, (all_ones and not keep_marker)
+
+def _iter_elements(f, start, end):
+    """Yield (id, data_start, data_end) for the EBML elements between start and end."""
+    offset = start
+    while end is None or offset < end:
+        f.seek(offset)
+        try:
+            element_id, _ = _read_vint(f, keep_marker=True)
+            size, unknown = _read_vint(f, keep_marker=False)
+        except ValueError:
+            return
+        data = f.tell()
+        data_end = end if unknown else data + size
+        yield element_id, data, data_end
+        if data_end is None:
+            return
+        offset = data_end
+
+def _read_uint(f, start, end):
+    f.seek(start)
+    return int.from_bytes(f.read(end - start), "big")
+
+def _probe_matroska(f):
+    f.seek(0, 2)
+    file_end = f.tell()
+
+    segment = None
+    for element_id, data, data_end in _iter_elements(f, 0, file_end):
+        if element_id == MKV_SEGMENT:
+            segment = (data, min(data_end, file_end))
+            break
+    if segment is None:
+        return None
+
+    width = height = None
+    date_captured = None
+    raw_duration = None
+    timecode_scale = 1_000_000
+
+    for element_id, data, data_end in _iter_elements(f, *segment):
+        if element_id == MKV_INFO:
+            for child_id, child, child_end in _iter_elements(f, data, data_end):
+                if child_id == MKV_TIMECODE_SCALE:
+                    timecode_scale = _read_uint(f, child, child_end)
+                elif child_id == MKV_DURATION:
+                    f.seek(child)
+                    raw = f.read(child_end - child)
+                    raw_duration = struct.unpack(">f" if len(raw) == 4 else ">d", raw)[0]
+                elif child_id == MKV_DATE_UTC:
+                    f.seek(child)
+                    nanoseconds = int.from_bytes(f.read(child_end - child), "big", signed=True)
+                    date_captured = _format_timestamp(MATROSKA_EPOCH_OFFSET + nanoseconds / 1e9)
+        elif element_id == MKV_TRACKS:
+            for entry_id, entry, entry_end in _iter_elements(f, data, data_end):
+                if entry_id != MKV_TRACK_ENTRY or width is not None:
+                    continue
+                for child_id, child, child_end in _iter_elements(f, entry, entry_end):
+                    if child_id != MKV_VIDEO:
+                        continue
+                    for video_id, video, video_end in _iter_elements(f, child, child_end):
+                        if video_id == MKV_PIXEL_WIDTH:
+                            width = _read_uint(f, video, video_end)
+                        elif video_id == MKV_PIXEL_HEIGHT:
+                            height = _read_uint(f, video, video_end)
+        elif element_id == MKV_CLUSTER:
+            # Frame data follows, the headers we need come before it
+            break
+
+    duration = raw_duration * timecode_scale / 1e9 if raw_duration is not None else None
+    return width, height, "MKV", date_captured, duration
+
+def _probe_avi(f):
+    # RIFF 'AVI ' -> LIST 'hdrl' -> 'avih' is always the first header
+    f.seek(12)
+    list_header = f.read(12)
+    if list_header[:4] != b"LIST" or list_header[8:12] != b"hdrl":
+        return None
+    chunk = f.read(8)
+    if chunk[:4] != b"avih":
+        return None
+
+    avih = f.read(40)
+    micro_sec_per_frame, _, _, _, total_frames = struct.unpack("<5I", avih[:20])
+    width, height = struct.unpack("<II", avih[32:40])
+    duration = total_frames * micro_sec_per_frame / 1e6 if micro_sec_per_frame else None
+    return width or None, height or None, "AVI", None, duration
@@ -0,0 +1,119 @@
+import itertools
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+request_ids = itertools.count(1)
+
+class DatabaseRequest:
+    """
+    One call of a MediaDatabase method sent to the DatabaseWorker.
+
+    Created on the GUI thread, which also owns its future. The worker fills
+    in the timing, status and result, then settles the future.
+    """
+
+    def __init__(self, method_name, args=(), kwargs=None, context=None,
+                 ticket=None, stream=False, lane=None):
+        self.request_id = next(request_ids)
+        self.method_name = method_name
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.context = context
+        self.ticket = ticket  # (key, token) from DatabaseWorker.supersede, or None
+        self.stream = stream  # results arrive in chunks, see RequestFuture.chunk
+        self.lane = lane  # scheduling lane, None looks it up from the method
+
+        self.status = "pending"  # then "running", and "done", "failed" or "cancelled"
+        self.cancelled = False
+        self.result = None  # the return value, or the chunk count of a stream
+        self.error = None
+        self.submitted = None  # perf_counter times
+        self.started = None
+        self.finished = None
+        self.merged = []  # (request, index into result) for buffered writes this batch carries
+        self.future = RequestFuture(self)
+
+    @property
+    def queue_time(self):
+        """Seconds spent waiting for a thread, or None if it never started."""
+        if self.submitted is None or self.started is None:
+            return None
+        return self.started - self.submitted
+
+    @property
+    def run_time(self):
+        """Seconds spent running, or None if it never finished."""
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def timing(self):
+        queued = self.queue_time
+        ran = self.run_time
+        return (f"queued {queued * 1000:.1f} ms, " if queued is not None else "") + \
+               (f"ran {ran * 1000:.1f} ms" if ran is not None else "did not run")
+
+    def __repr__(self):
+        return f"<DatabaseRequest #{self.request_id} {self.method_name} {self.status}>"
+
+class RequestFuture(QObject):
+    """
+    The pending result of a DatabaseRequest, living on the thread that made it.
+
+    The worker settles it through queued signals, so its own signals are
+    always emitted on that thread and their slots can touch widgets.
+    """
+    done = pyqtSignal(object)  # result, or the chunk count of a stream
+    failed = pyqtSignal(str)  # error message
+    cancelled = pyqtSignal()
+    chunk = pyqtSignal(int, object)  # sequence, rows, for streamed requests
+
+    def __init__(self, request):
+        super().__init__()
+        self.request = request
+        self.worker = None  # set by DatabaseWorker.submit, used to cancel
+        self.settled = False
+
+    def cancel(self):
+        """
+        Cancel the request. It is skipped if still queued, and its query is
+        interrupted if running. cancelled is emitted straight away.
+        """
+        if self.settled:
+            return
+        self.request.cancelled = True
+        if self.worker is not None:
+            self.worker.cancel(self.request)
+        self.settled = True
+        self.request.status = "cancelled"
+        self.cancelled.emit()
+
+    def deliver_chunk(self, sequence, rows):
+        # Chunks already queued when the request was superseded are dropped
+        # here, since supersede runs on this thread too
+        if self.settled or (self.worker is not None and self.worker.is_stale(self.request)):
+            return
+        self.chunk.emit(sequence, rows)
+
+    def settle(self):
+        if self.settled:
+            return
+        self.settled = True
+
+        request = self.request
+        match request.status:
+            case "done":
+                self.done.emit(request.result)
+            case "failed":
+                self.failed.emit(request.error)
+            case _:
+                self.cancelled.emit()
+
+        # Buffered writes end the way the batch that carried them did
+        for merged, index in request.merged:
+            merged.status = request.status
+            merged.result = request.result[index] if request.status == "done" else None
+            merged.error = request.error
+            merged.started = request.started
+            merged.finished = request.finished
+            merged.future.settle()
@@ -0,0 +1,177 @@
+import hashlib
+import os
+from collections import namedtuple
+from datetime import datetime
+from PIL import Image
+
+from components.Probe import probe_image, probe_video
+
+SUPPORTED_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.mp4', '.avi', '.mov', '.mkv'}
+VIDEO_EXTS = {'.mp4', '.avi', '.mov', '.mkv'}
+
+# A candidate file found by the walker, with the stat values it already read
+MediaFile = namedtuple("MediaFile", ["path", "size", "mtime_ns"])
+
+def iter_media_files(roots, recursive=True):
+    """
+    Lazily yield a MediaFile for every supported file under the given roots.
+
+    Built on os.scandir so the stat result cached on each DirEntry is reused,
+    and uses an explicit stack so memory only grows with the directory depth.
+    Symlinked directories are not followed to avoid cycles.
+    """
+    if isinstance(roots, (str, os.PathLike)):
+        roots = [roots]
+
+    stack = [str(root) for root in reversed(list(roots))]
+    while stack:
+        directory = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTS and entry.is_file():
+                            stat = entry.stat()
+                            yield MediaFile(entry.path, stat.st_size, stat.st_mtime_ns)
+                    except OSError as e:
+                        print(f"Scan error for {entry.path}: {e}")
+        except OSError as e:
+            print(f"Scan error for {directory}: {e}")
+            continue
+
+        if recursive:
+            stack.extend(reversed(subdirs))
+
+def iter_media_directories(roots):
+    """Lazily yield every directory under the given roots, roots first, without following symlinks."""
+    if isinstance(roots, (str, os.PathLike)):
+        roots = [roots]
+
+    stack = [str(root) for root in reversed(list(roots))]
+    while stack:
+        directory = stack.pop()
+        yield directory
+        try:
+            with os.scandir(directory) as entries:
+                subdirs = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError as e:
+            print(f"Scan error for {directory}: {e}")
+            continue
+        stack.extend(reversed(subdirs))
+
+def iter_chunks(iterable, size):
+    """Group an iterable into lists of at most size items without materialising it."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def extract_metadata_batch(media_files):
+    return [try_extract_metadata(media_file) for media_file in media_files]
+
+def try_extract_metadata(media_file):
+    """extract_metadata that returns None instead of raising, so an unreadable file only fails itself."""
+    try:
+        return extract_metadata(media_file)
+    except Exception as e:
+        print(f"Metadata error for {media_file.path}: {e}")
+        return None
+
+def extract_metadata(media_file, hash_contents=True):
+    """
+    Read the metadata of a single media file found by iter_media_files.
+
+    Kept at module level so it can be pickled into a process pool.
+
+    Parameters:
+        hash_contents (bool): Whether to read the whole file for its hash,
+            otherwise the hash is left as None.
+
+    Returns:
+        tuple: The media row values, in the column order used for inserts.
+    """
+    filepath, filesize, mtime_ns = media_file
+    filename = os.path.basename(filepath)
+    ext = os.path.splitext(filename)[1].lower()
+
+    file_type = "video" if ext in VIDEO_EXTS else "image"
+
+    # Use the modification time instead of st_ctime (platform dependent)
+    date_added = datetime.fromtimestamp(mtime_ns // 1_000_000_000).strftime("%Y-%m-%d %H:%M:%S")
+
+    width = height = None
+    format_ = None
+    date_captured = None
+    camera_model = None
+    duration = None
+
+    if file_type == "image":
+        probed = probe_image(filepath) or pillow_probe(filepath)
+        width, height, format_, date_captured, camera_model = probed
+    else:
+        probed = probe_video(filepath)
+        if probed:
+            width, height, format_, date_captured, duration = probed
+
+    return (
+        filepath, filename, file_type, width, height,
+        filesize, format_, date_captured, camera_model, date_added,
+        mtime_ns, hash_file(filepath) if hash_contents else None, duration
+    )
+
+def hash_file(filepath, chunk_size=1 << 20):
+    """
+    BLAKE2b digest of the file contents, read in chunks so large videos are not loaded whole.
+
+    Returns:
+        str | None: The hex digest, or None if the file could not be read.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(filepath, "rb") as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)
+    except OSError as e:
+        print(f"Hash error for {os.path.basename(filepath)}: {e}")
+        return None
+    return digest.hexdigest()
+
+def pillow_probe(filepath):
+    """
+    Fallback for probe_image that lets Pillow open the file and decode its EXIF.
+
+    Returns:
+        tuple: (width, height, format, date_captured, camera_model), with
+            whatever could be read before an error left as None.
+    """
+    width = height = None
+    format_ = None
+    date_captured = None
+    camera_model = None
+
+    try:
+        with Image.open(filepath) as img:
+            width, height = img.size
+            format_ = img.format
+            exif_data = img._getexif()
+            if exif_data:
+                # EXIF tag 36867 = DateTimeOriginal
+                raw_date = exif_data.get(36867)
+                if raw_date:
+                    try:
+                        date_captured = datetime.strptime(raw_date, "%Y:%m:%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+                    except Exception:
+                        pass
+                # EXIF tag 272 = Model (camera)
+                camera_model = exif_data.get(272)
+    except Exception as e:
+        print(f"Metadata error for {os.path.basename(filepath)}: {e}")
+
+    return width, height, format_, date_captured, camera_model
@@ -0,0 +1,151 @@
+import threading
+
+class TagIndex:
+    """
+    In memory index of which media carry which tag, used to answer the tag
+    filters without grouping over media_tags.
+
+    Each tag keeps the set of its media ids. CPython's set union, intersection
+    and difference run in C and only walk the smaller operand where they can,
+    so "any", "all" and "exact" are a handful of set operations however many
+    tags exist. The index is loaded once and kept up to date by the
+    MediaDatabase tag methods.
+    """
+
+    def __init__(self):
+        self.tag_ids = {}  # tag name -> tag id
+        self.media_by_tag = {}  # tag id -> set of media ids
+        self.tag_counts = {}  # media id -> number of tags it carries
+        self.loaded = False
+        self.data_version = None  # the database's data_version when loaded
+        self.lock = threading.Lock()
+
+    def load(self, cursor, data_version=None):
+        with self.lock:
+            self.tag_ids = {}
+            self.media_by_tag = {}
+            self.tag_counts = {}
+
+            cursor.execute("SELECT id, name FROM tags")
+            for tag_id, name in cursor.fetchall():
+                self.tag_ids[name] = tag_id
+                self.media_by_tag[tag_id] = set()
+
+            cursor.execute("SELECT media_id, tag_id FROM media_tags")
+            for media_id, tag_id in cursor.fetchall():
+                self.media_by_tag.setdefault(tag_id, set()).add(media_id)
+                self.tag_counts[media_id] = self.tag_counts.get(media_id, 0) + 1
+
+            self.data_version = data_version
+            self.loaded = True
+
+    def reset(self):
+        """Forget everything, so the next query reloads from the database."""
+        with self.lock:
+            self.loaded = False
+            self.tag_ids = {}
+            self.media_by_tag = {}
+            self.tag_counts = {}
+
+    def match(self, tag_names, tag_mode):
+        """
+        Find the media selected by a tag filter.
+
+        Parameters:
+            tag_names (list[str]): The tags in the filter.
+            tag_mode (str): "any", "all" or "exact" return the media to keep,
+                "none" returns the media to leave out.
+
+        Returns:
+            set[int]: Media ids.
+        """
+        with self.lock:
+            known = [self.tag_ids[name] for name in tag_names if name in self.tag_ids]
+            sets = sorted((self.media_by_tag[tag_id] for tag_id in known), key=len)
+
+            match tag_mode:
+                case "any" | "none":
+                    return set().union(*sets)
+
+                case "all" | "exact":
+                    # A tag nobody has means nothing can match
+                    if not sets or len(known) < len(tag_names):
+                        return set()
+                    result = sets[0].intersection(*sets[1:])
+                    if tag_mode == "exact":
+                        count = len(known)
+                        result = {media_id for media_id in result if self.tag_counts[media_id] == count}
+                    return result
+
+                case _:
+                    raise ValueError(f"Unknown tag_mode: {tag_mode}")
+
+    def size_bound(self, tag_names, tag_mode):
+        """An upper bound on the size of match(tag_names, tag_mode), without building it."""
+        with self.lock:
+            sizes = [len(self.media_by_tag[self.tag_ids[name]]) for name in tag_names if name in self.tag_ids]
+            if tag_mode in ("all", "exact"):
+                return min(sizes) if len(sizes) == len(tag_names) else 0
+            return sum(sizes)
+
+    def count(self, tag_names, tag_mode):
+        """Return len(match(tag_names, tag_mode)), without copying a single tag's set."""
+        if tag_mode in ("any", "none") and len(tag_names) == 1:
+            with self.lock:
+                tag_id = self.tag_ids.get(tag_names[0])
+                return len(self.media_by_tag[tag_id]) if tag_id is not None else 0
+        return len(self.match(tag_names, tag_mode))
+
+    def ids(self, tag_names):
+        """Return the ids of the tags that exist, sorted."""
+        with self.lock:
+            return sorted(self.tag_ids[name] for name in tag_names if name in self.tag_ids)
+
+    def counts(self):
+        """Return the number of media carrying each tag, by tag name."""
+        with self.lock:
+            return {name: len(self.media_by_tag.get(tag_id, ())) for name, tag_id in self.tag_ids.items()}
+
+    def add_tag(self, tag_id, name):
+        with self.lock:
+            self.tag_ids[name] = tag_id
+            self.media_by_tag.setdefault(tag_id, set())
+
+    def rename_tag(self, tag_id, old_name, new_name):
+        with self.lock:
+            self.tag_ids.pop(old_name, None)
+            self.tag_ids[new_name] = tag_id
+
+    def remove_tag(self, tag_id, name):
+        with self.lock:
+            self.tag_ids.pop(name, None)
+            for media_id in self.media_by_tag.pop(tag_id, set()):
+                self.decrement(media_id)
+
+    def add_media_tags(self, media_ids, tag_ids):
+        with self.lock:
+            for tag_id in tag_ids:
+                media_set = self.media_by_tag.setdefault(tag_id, set())
+                for media_id in media_ids:
+                    if media_id not in media_set:
+                        media_set.add(media_id)
+                        self.tag_counts[media_id] = self.tag_counts.get(media_id, 0) + 1
+
+    def remove_media(self, media_ids):
+        """Drop every tag from the given media, for tag replacement or deleted rows."""
+        with self.lock:
+            removed = {media_id for media_id in media_ids if self.tag_counts.pop(media_id, 0)}
+            if not removed:
+                return
+            for media_set in self.media_by_tag.values():
+                # & walks the smaller set, so small tags stay cheap however many media go
+                hit = media_set & removed
+                if hit:
+                    media_set -= hit
+
+    def decrement(self, media_id):
+        count = self.tag_counts.get(media_id, 0) - 1
+        if count > 0:
+            self.tag_counts[media_id] = count
+        else:
+            self.tag_counts.pop(media_id, None)
@@ -24,6 +24,7 @@ class TagRow(StyledWidget):
         self.read_only = read_only
         
         self.tag_name = tag_name
+        self.count = None  # matches shown beside the name, if known
         self.is_active = False
         self.is_editing = False
 
@@ -75,7 +76,17 @@ class TagRow(StyledWidget):
 
     def set_text(self, txt):
         self.tag_name = txt
-        self.tag_button.setText(txt)
+        self.update_label()
+
+    def set_count(self, count):
+        self.count = count
+        self.update_label()
+
+    def update_label(self):
+        if self.count is None:
+            self.tag_button.setText(self.tag_name)
+        else:
+            self.tag_button.setText(f"{self.tag_name} ({self.count})")
 
     def toggle_active(self):
         self.set_active(not self.is_active)
@@ -243,6 +254,11 @@ class TagList(StyledWidget):
         tag_row.on_edit.connect(lambda: self.open_edit(tag_row))
         return tag_row
 
+    def set_counts(self, counts):
+        """Show how many matches each tag has, from a dict of tag name -> count."""
+        for tag in self.tags:
+            tag.set_count(counts.get(tag.tag_name, 0))
+
     def clear_tags(self):
         for i in reversed(range(self.content_layout.count() - 1)):
             item = self.content_layout.itemAt(i)
@@ -0,0 +1,128 @@
+import os
+
+from PyQt5.QtCore import QObject, QTimer, QFileSystemWatcher, pyqtSignal
+
+class MediaWatcher(QObject):
+    """
+    Watches every directory under the media roots and reports bursts of
+    changes as one batch of directories to rescan.
+
+    QFileSystemWatcher reports a directory when entries are created,
+    deleted or renamed in it. Edits made in place to an existing file are
+    not reported and are picked up by the next full rescan instead.
+
+    A directory is only reported once the names, sizes and modification
+    times of its files are the same at two flushes in a row, so files still
+    being copied in are not indexed half written.
+    """
+    changes_ready = pyqtSignal(list)  # directories to rescan
+
+    def __init__(self, roots, debounce_ms=300, parent=None):
+        super().__init__(parent)
+        if isinstance(roots, (str, os.PathLike)):
+            roots = [roots]
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._on_directory_changed)
+
+        # Qt may report a cleaned up spelling of the paths it was given,
+        # so map them back to the spelling used by the media walker
+        self.directories = {}
+        self.pending = set()
+        self.snapshots = {}  # pending directory -> its files at the last flush
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounce_ms)
+        self.timer.timeout.connect(self._flush)
+
+        for root in roots:
+            self.watch_tree(str(root))
+
+    def watch_tree(self, root):
+        """Watch root and every directory below it, returning the newly watched paths."""
+        added = []
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            key = os.path.normpath(directory)
+            if key in self.directories:
+                continue
+            self.directories[key] = directory
+            added.append(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError as e:
+                print(f"Watch error for {directory}: {e}")
+
+        if added:
+            # Paths Qt could not watch, often from the system's watch limit,
+            # are still indexed but their later changes wait for a full rescan
+            for path in self.watcher.addPaths(added):
+                print(f"Watch error for {path}: could not watch directory")
+        return added
+
+    def _on_directory_changed(self, path):
+        directory = self.directories.get(os.path.normpath(path), path)
+        self.pending.add(directory)
+
+        if os.path.isdir(directory):
+            # Folders copied or moved in need watching, and their files indexing
+            try:
+                with os.scandir(directory) as entries:
+                    subdirs = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+            except OSError:
+                subdirs = []
+            for subdir in subdirs:
+                self.pending.update(self.watch_tree(subdir))
+        else:
+            # A removed folder takes its watched subfolders with it
+            prefix = os.path.join(os.path.normpath(path), "")
+            for key in [k for k in self.directories if k == os.path.normpath(path) or k.startswith(prefix)]:
+                self.pending.add(self.directories.pop(key))
+
+        self.timer.start()
+
+    def _flush(self):
+        ready = []
+        for directory in sorted(self.pending):
+            snapshot = self.snapshot(directory)
+            if snapshot is None or snapshot == self.snapshots.get(directory):
+                ready.append(directory)
+            else:
+                # Still changing, look again after another quiet interval
+                self.snapshots[directory] = snapshot
+
+        for directory in ready:
+            self.pending.discard(directory)
+            self.snapshots.pop(directory, None)
+
+        if self.pending:
+            self.timer.start()
+        if ready:
+            self.changes_ready.emit(ready)
+
+    def snapshot(self, directory):
+        """
+        Returns:
+            frozenset: (name, size, mtime) of each file in directory, or None
+                if it can no longer be read.
+        """
+        try:
+            with os.scandir(directory) as entries:
+                return frozenset(
+                    (entry.name, stat.st_size, stat.st_mtime_ns)
+                    for entry in entries if entry.is_file(follow_symlinks=False)
+                    for stat in (entry.stat(follow_symlinks=False),)
+                )
+        except OSError:
+            return None
+
+    def stop(self):
+        self.timer.stop()
+        self.pending.clear()
+        self.snapshots.clear()
+        paths = self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
@@ -10,7 +10,7 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtGui import QIcon
 
 from PyQt5.QtCore import (
-    Qt, QSize, QTimer, QMetaObject, Q_ARG, QThread, pyqtSignal
+    Qt, QSize, QTimer, QMetaObject, QThread, pyqtSignal
 )
 
 from components.Sidebar import Sidebar
@@ -25,7 +25,10 @@ from components.Gallery import (
     Gallery, GalleryCell, GalleryCellEdit
 )
 from components.Slideshow import SlideShow
-from components.Database import DatabaseWorker
+from components.Database import DatabaseWorker, MEDIA_PATH
+from components.Requests import DatabaseRequest
+from components.Watcher import MediaWatcher
+from components.Indexer import IndexWorker
 
 class MainWindow(QMainWindow):
     def __init__(self, image_folder=None):
@@ -49,14 +52,25 @@ class MainWindow(QMainWindow):
         self.widgets_search = []
         self.widgets_sort = []
         self.widgets_filter = []
+        self.facet_dropdowns = {}  # filter_key -> Dropdown showing match counts
+        self.closing = False  # set by closeEvent, refreshes stop from then on
         
         self.db = DatabaseWorker("database.db")
-        self.db.results_ready.connect(self.handle_results)
-        self.db.error.connect(self.handle_error)
+        self.db.progress.connect(self.handle_progress)
         
         self.db_thread = QThread()
         self.db.moveToThread(self.db_thread)
         self.db_thread.start()
+        # Open and migrate the database on the worker thread rather than here
+        QMetaObject.invokeMethod(self.db, "init_db", Qt.QueuedConnection)
+
+        # Full incremental indexing runs as a resumable background job on the worker
+        self.indexer = IndexWorker(self.db)
+        self.indexer.finished.connect(self.handle_index_finished)
+
+        # Index new, changed and removed files as they appear on disk
+        self.watcher = MediaWatcher(MEDIA_PATH, parent=self)
+        self.watcher.changes_ready.connect(self.index_directories)
 
         # Sidebar 1
         self.sidebar1 = Sidebar()
@@ -88,10 +102,10 @@ class MainWindow(QMainWindow):
         self.sidebar1.add_spacer(self.grid_spacing)
         
         widget = Dropdown(["Name", "ID", "Size", "Height", "Width",
-                           "Times Viewed", "Duration Viewed",
+                           "Times Viewed", "Duration Viewed", "Length",
                            "Date Captured", "Date Added"],
                           values=["filename", "id", "filesize", "height", "width",
-                                  "times_viewed", "time_viewed",
+                                  "times_viewed", "time_viewed", "duration",
                                   "date_captured", "date_added"],
                           filter_key="sort_value")
         widget.on_filter_changed.connect(self.update_filter)
@@ -120,25 +134,23 @@ class MainWindow(QMainWindow):
                           filter_key="is_favourite")
         widget.on_filter_changed.connect(self.update_filter)
         self.widgets_filter.append(widget)
+        self.facet_dropdowns["is_favourite"] = widget
         self.sidebar1.add_widget(widget, 24)
         
         # File Type
         subheader = self.sidebar1.add_subheader("File Type", height=24, filter_key="type")
         self.widgets_filter.append(subheader)
         subheader.toggled.connect(self.update_filter_active)
-        self.call_worker("get_unique_values", "type", context="filter_type")
 
         # Format
         subheader = self.sidebar1.add_subheader("Format", height=24, filter_key="format")
         self.widgets_filter.append(subheader)
         subheader.toggled.connect(self.update_filter_active)
-        self.call_worker("get_unique_values", "format", context="filter_format")
 
         # Camera
         subheader = self.sidebar1.add_subheader("Camera", height=24, filter_key="camera_model")
         self.widgets_filter.append(subheader)
         subheader.toggled.connect(self.update_filter_active)
-        self.call_worker("get_unique_values", "camera_model", context="filter_camera")
         
         subheader = self.sidebar1.add_subheader("File Size", height=24, filter_key="filesize")
         self.widgets_filter.append(subheader)
@@ -180,6 +192,14 @@ class MainWindow(QMainWindow):
         self.widgets_filter.append(widget)
         self.sidebar1.add_widget(widget, 24)
         
+        subheader = self.sidebar1.add_subheader("Video Length", height=24, filter_key="duration")
+        self.widgets_filter.append(subheader)
+        subheader.toggled.connect(self.update_filter_active)
+        widget = RangeInput(0, 999999999, filter_key="duration")
+        widget.on_filter_changed.connect(self.update_filter)
+        self.widgets_filter.append(widget)
+        self.sidebar1.add_widget(widget, 24)
+        
         subheader = self.sidebar1.add_subheader("Date Captured", height=24, filter_key="date_captured")
         self.widgets_filter.append(subheader)
         subheader.toggled.connect(self.update_filter_active)
@@ -243,7 +263,7 @@ class MainWindow(QMainWindow):
         self.tag_list.on_add.connect(self.add_tag)
         self.tag_list.on_edit.connect(self.edit_tag)
         self.sidebar2.add_widget(self.tag_list)
-        self.call_worker("get_all_tags", context="all_tags")
+        self.call_worker("get_all_tags", context="all_tags").done.connect(self.populate_tags)
 
         self.sidebar2.add_spacer(self.grid_spacing)
         self.sidebar2.add_header("Other", 32)
@@ -252,7 +272,7 @@ class MainWindow(QMainWindow):
         # Details
         self.sidebar2.add_subheader_flat("Details", 24)
         items = ["Dimensions", "Filesize", "Camera Model", "Times Viewed",
-                 "Duration Viewed", "Date Captured", "Date Added"]
+                 "Duration Viewed", "Length", "Date Captured", "Date Added"]
         for item in items:
             btn = TextButton(item, toggle_class="tag_row_button", height="fixed")
             btn.on_toggle.connect(lambda _, i=item: self.update_details(i))
@@ -269,6 +289,14 @@ class MainWindow(QMainWindow):
         
         self.sidebar2.add_spacer(self.grid_spacing)
 
+        # Library
+        self.sidebar2.add_subheader_flat("Library", 24)
+        widget = TextButton("Rescan", height="fixed")
+        widget.clicked.connect(self.start_indexing)
+        self.sidebar2.add_widget(widget, 24)
+
+        self.sidebar2.add_spacer(self.grid_spacing)
+
         # Apply Filters
         button = TextButton("Apply", height="fixed")
         button.setObjectName("apply_button")
@@ -323,75 +351,81 @@ class MainWindow(QMainWindow):
         self.gallery.update_details()
         col_input.set_value(gallery_cols)
 
+        # Continue an index job left unfinished by the last session
+        self.call_worker("get_unfinished_index_job").done.connect(self.resume_indexing)
+
     def call_worker(self, method_name, *args, **kwargs):
+        """
+        Send a MediaDatabase call to the DatabaseWorker.
+
+        Returns:
+            RequestFuture: Emits done, failed or cancelled on this thread once the call ends.
+        """
         context = kwargs.pop("context", None)
-        QMetaObject.invokeMethod(
-            self.db,
-            "run_task",
-            Qt.QueuedConnection,
-            Q_ARG(str, method_name),
-            Q_ARG(object, args),
-            Q_ARG(object, kwargs),
-            Q_ARG(object, context)
-        )
+        stream = kwargs.pop("stream", False)  # rows arrive through the future's chunk signal
+        supersede = kwargs.pop("supersede", None)  # newer calls with this key cancel older ones
+        lane = kwargs.pop("lane", None)  # scheduling lane, by default looked up from the method
+        ticket = self.db.supersede(supersede) if supersede else None
+
+        request = DatabaseRequest(method_name, args, kwargs, context, ticket, stream, lane)
+        request.future.failed.connect(lambda message: self.handle_error(method_name, message, context))
+        return self.db.submit(request)
+
+    def call_batch(self, calls, context=None):
+        """Send several (method_name, args, kwargs) calls to run and commit in one transaction."""
+        return self.call_worker("run_batch", calls, context=context)
+
+    def handle_tag_added(self, tag, added):
+        if added:
+            widget = self.tag_list.add_tag(tag, insert_alpha=True)
+            widget.on_filter_changed.connect(self.update_filter_tags)
+            self.all_tags.append(tag)
+        else:
+            print(f"Failed to add tag: {tag}")
+
+    def handle_tag_renamed(self, old_tag, new_tag, renamed):
+        if renamed:
+            self.all_tags = [new_tag if t == old_tag else t for t in self.all_tags]
+            self.tag_list.close_edit(new_tag)
+
+    def handle_tag_removed(self, tag_name, removed):
+        if removed:
+            self.all_tags.remove(tag_name)
+            self.tag_list.delete_tag(tag_name)
+            if not self.all_tags:
+                self.gallery.filters['tags'].clear()
+
+    def handle_rescan(self, summary):
+        if summary["added"] or summary["updated"] or summary["moved"] or summary["removed"]:
+            self.apply_filters()
+
+    def handle_gallery_chunk(self, sequence, chunk):
+        if sequence == 0:
+            self.gallery.clear_grid_layout(self.gallery.grid_layout)
+
+        for record in chunk:
+            self.gallery.add_cell(GalleryCell(record, window=self, parent=self.gallery))
+        self.gallery.update_cell_sizes()
+
+    def handle_gallery_finished(self, chunk_count):
+        if self.closing:
+            return
+        print(f"[DEBUG] Got {self.gallery.cell_count} records from DB")
+        if chunk_count == 0:
+            self.gallery.clear_grid_layout(self.gallery.grid_layout)
+
+        self.gallery.update_cell_sizes()
+        self.gallery.update_details()
+        self.slideshow.set_image_paths(self.gallery.get_image_paths())
+        print("[DEBUG] Populated gallery")
 
-    def handle_results(self, method_name, result, context=None):
-        match method_name:
-            case "add_tag":
-                if result:
-                    widget = self.tag_list.add_tag(context, insert_alpha=True)
-                    widget.on_filter_changed.connect(self.update_filter_tags)
-                    self.all_tags.append(context)
-                else:
-                    print(f"Failed to add tag: {context}")
-
-            case "get_unique_values":
-                match context:
-                    case "filter_type":
-                        self.add_filter_dropdown("type", result)
-                    case "filter_format":
-                        self.add_filter_dropdown("format", result)
-                    case "filter_camera":
-                        self.add_filter_dropdown("camera_model", result)
-
-            case "rename_tag":
-                if result:
-                    _, old_tag, new_tag = context
-                    self.all_tags = [new_tag if t == old_tag else t for t in self.all_tags]
-                    self.tag_list.close_edit(new_tag)
-
-            case "remove_tag_by_name":
-                if result:
-                    _, tag_name = context
-                    self.all_tags.remove(tag_name)
-                    self.tag_list.delete_tag(tag_name)
-                    if not self.all_tags:
-                        self.gallery.filters['tags'].clear()
-
-            case "apply_filters" if context == "populate_gallery":
-                image_records = result
-                print(f"[DEBUG] Got {len(image_records)} records from DB")
-                
-                self.gallery.clear_grid_layout(self.gallery.grid_layout)
-
-                i = 0
-                for record in image_records:
-                    if i >= self.gallery.cells_max:
-                        break
-                    self.gallery.add_cell(GalleryCell(record, window=self, parent=self.gallery))
-                    i += 1
-
-                self.gallery.update_cell_sizes()
-                self.gallery.update_details()
-                self.slideshow.set_image_paths(self.gallery.get_image_paths())
-                print("[DEBUG] Populated gallery")
-
-            case "get_all_tags":
-                self.populate_tags(result)
+        # Refresh the sidebar match counts for the new filters
+        self.call_worker("get_facets", self.gallery.filters, self.gallery.filters_active,
+                         supersede="facets").done.connect(self.update_facets)
 
     def handle_error(self, method_name, error_message, context=None):
         """
-        Handles errors from the DatabaseWorker.
+        Handles a failed DatabaseWorker call.
 
         Parameters:
             method_name (str): The name of the DB method that failed.
@@ -400,11 +434,58 @@ class MainWindow(QMainWindow):
         """
         print(f"[DB ERROR] Method: {method_name}, Context: {context}, Error: {error_message}")
 
+    def handle_progress(self, method_name, stats):
+        """Show ingest throughput, and an ETA when the total is known, in the status bar."""
+        message = (
+            f"Indexing: {stats['scanned']:,} scanned, "
+            f"{stats['inserted'] + stats['updated']:,} written, "
+            f"{stats['failed']:,} failed - {stats['rate']:,.0f} files/s"
+        )
+
+        total = stats.get("total")
+        if total and stats["rate"] > 0 and total > stats["scanned"]:
+            minutes, seconds = divmod(int((total - stats["scanned"]) / stats["rate"]), 60)
+            message += f" - ETA {minutes}m {seconds:02d}s"
+
+        self.statusBar().showMessage(message, 5000)
+
+    def handle_index_finished(self, status, summary):
+        self.statusBar().showMessage(
+            f"Indexing {status}: {summary['added']:,} added, {summary['updated']:,} updated, "
+            f"{summary['moved']:,} moved, {summary['removed']:,} removed",
+            10000
+        )
+        if summary["added"] or summary["updated"] or summary["moved"] or summary["removed"]:
+            self.apply_filters()
+
+    def start_indexing(self):
+        self.indexer.run()
+
+    def resume_indexing(self, job_id):
+        if job_id is not None:
+            self.start_indexing()
+
+    def closeEvent(self, event):
+        # Requests finishing during shutdown must not start refreshes
+        self.closing = True
+        self.indexer.finished.disconnect(self.handle_index_finished)
+        self.watcher.changes_ready.disconnect(self.index_directories)
+        self.db.progress.disconnect(self.handle_progress)
+
+        # Pausing keeps the job's checkpoints so the next launch resumes it
+        self.indexer.pause()
+        self.watcher.stop()
+        self.db.shutdown()
+        self.db_thread.quit()
+        self.db_thread.wait()
+        super().closeEvent(event)
+
     def add_filter_dropdown(self, filter_key, items):
         items = [x for x in items if x is not None]
-        dropdown = Dropdown(items, filter_key=filter_key)
+        dropdown = Dropdown(items, values=list(items), filter_key=filter_key)
         dropdown.on_filter_changed.connect(self.update_filter)
         self.widgets_filter.append(dropdown)
+        self.facet_dropdowns[filter_key] = dropdown
 
         layout = self.sidebar1.layout()
         for i in range(layout.count()):
@@ -413,6 +494,24 @@ class MainWindow(QMainWindow):
                 layout.insertWidget(i + 1, dropdown)
                 break
 
+    def update_facets(self, facets):
+        """Show the match counts from get_facets beside the sidebar filters."""
+        for filter_key in ("is_favourite", "type", "format", "camera_model"):
+            counts = {value: count for value, count in facets[filter_key].items() if value is not None}
+            if filter_key not in self.facet_dropdowns:
+                self.add_filter_dropdown(filter_key, sorted(counts))
+            self.facet_dropdowns[filter_key].set_counts(counts)
+
+        self.tag_list.set_counts(facets["tags"])
+
+        for widget in self.widgets_filter:
+            if isinstance(widget, (RangeInput, DateTimeRangeInput)):
+                value_range = facets["ranges"].get(widget.filter_key)
+                if value_range:
+                    widget.setToolTip(f"Matches range from {value_range[0]} to {value_range[1]}")
+                else:
+                    widget.setToolTip("No matches")
+
     def populate_tags(self, tags):
         self.all_tags = tags
         for tag in tags:
@@ -426,10 +525,14 @@ class MainWindow(QMainWindow):
         self.gallery_edit.set_data(data, sorted(self.all_tags), cell)
 
     def apply_gallery_edit(self, image_id, filename, tags):
+        # Saved together, in one transaction
+        calls = []
         if filename:
-            self.call_worker("set_image_filename", image_id, filename)
+            calls.append(("set_image_filename", (image_id, filename), {}))
         if tags is not None:
-            self.call_worker("set_image_tags", image_id, tags)
+            calls.append(("set_image_tags", (image_id, tags), {}))
+        if calls:
+            self.call_batch(calls, context=("gallery_edit", image_id))
 
     def close_gallery_edit(self):
         self.gallery_edit.hide()
@@ -443,19 +546,26 @@ class MainWindow(QMainWindow):
         self.gallery.set_columns(amount)
 
     def add_tag(self, tag):
-        self.call_worker("add_tag", tag)
+        self.call_worker("add_tag", tag).done.connect(lambda added: self.handle_tag_added(tag, added))
     
     def edit_tag(self, old_tag, new_tag):
-        self.call_worker("rename_tag", old_tag, new_tag, context=("edit_tag", old_tag, new_tag))
+        future = self.call_worker("rename_tag", old_tag, new_tag, context=("edit_tag", old_tag, new_tag))
+        future.done.connect(lambda renamed: self.handle_tag_renamed(old_tag, new_tag, renamed))
 
 
     def delete_tag(self, tag):
         tag_name = tag.tag_name
-        self.call_worker("remove_tag_by_name", tag_name, context=("delete_tag", tag_name))
+        future = self.call_worker("remove_tag_by_name", tag_name, context=("delete_tag", tag_name))
+        future.done.connect(lambda removed: self.handle_tag_removed(tag_name, removed))
 
     def apply_filters(self):
+        if self.closing:
+            return
         self.gallery.populate_gallery()
 
+    def index_directories(self, directories):
+        self.call_worker("rescan_directories", directories, context="watcher").done.connect(self.handle_rescan)
+
     def update_filter_active(self, filter_key, value):
         if filter_key in self.gallery.filters_active:
             self.gallery.filters_active[filter_key] = value
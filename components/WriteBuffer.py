@@ -0,0 +1,65 @@
+import threading
+
+class WriteBuffer:
+    """
+    Holds small writes to single media rows until they are flushed together.
+
+    Writes are keyed by method and row, the row id being the first argument,
+    so a newer write to the same row replaces the older one. The replaced
+    requests travel with the one that replaced it and settle with it.
+    """
+
+    def __init__(self, methods):
+        self.methods = methods  # method names that may be buffered
+        self.pending = {}  # (method_name, row id) -> requests, newest last
+        self.lock = threading.Lock()
+
+    def accepts(self, request):
+        """Only plain calls are buffered, not streams or calls given their own lane."""
+        return (request.method_name in self.methods and request.args
+                and not request.stream and request.lane is None and request.ticket is None)
+
+    def add(self, request):
+        """
+        Returns:
+            bool: Whether the buffer was empty before this write.
+        """
+        key = (request.method_name, request.args[0])
+        with self.lock:
+            was_empty = not self.pending
+            self.pending.setdefault(key, []).append(request)
+            return was_empty
+
+    def discard(self, request):
+        """Drop a cancelled write, with the writes it replaced. Returns those requests."""
+        with self.lock:
+            for key, requests in self.pending.items():
+                if request in requests:
+                    del self.pending[key]
+                    return requests
+        return []
+
+    def take(self):
+        """
+        Empty the buffer.
+
+        Returns:
+            tuple: (calls, merged). calls are (method_name, args, kwargs) for
+                run_batch, the newest write per row. merged pairs every buffered
+                request with the index of the call that carries it.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        calls = []
+        merged = []
+        for requests in pending.values():
+            newest = requests[-1]
+            for request in requests:
+                merged.append((request, len(calls)))
+            calls.append((newest.method_name, newest.args, newest.kwargs))
+        return calls, merged
+
+    def __bool__(self):
+        with self.lock:
+            return bool(self.pending)